@@ -34,3 +34,14 @@ GRANT SELECT, INSERT, UPDATE, DELETE ON input.ceny_godzinowe TO "voytek";
 
 -- indeks pomocniczy po dacie (opcjonalnie)
 CREATE INDEX IF NOT EXISTS idx_input_ceny_godzinowe_ts ON input.ceny_godzinowe (ts_utc);
+
+-- walidatory HTTP ostatniego pobrania (ETag / Last-Modified / Content-Length) per URL
+-- warunkowy GET w update_import, HEAD przed full_import
+CREATE TABLE IF NOT EXISTS input.tge_fetch_meta (
+    url             text PRIMARY KEY,
+    etag            text,
+    last_modified   text,
+    content_length  bigint,
+    updated_at      timestamptz NOT NULL DEFAULT now()
+);
+GRANT SELECT, INSERT, UPDATE ON input.tge_fetch_meta TO "voytek";
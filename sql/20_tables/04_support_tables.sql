@@ -76,6 +76,24 @@ CREATE INDEX IF NOT EXISTS idx_health_service_scope_created
 CREATE INDEX IF NOT EXISTS idx_health_service_calc
   ON output.health_service (calc_id);
 
+-- 5) CACHE WYNIKÓW KALKULACJI (runner, CALC_CACHE=1: klucz = hash norm + wersji wejść + kodu etapów)
+CREATE TABLE IF NOT EXISTS output.calc_cache (
+  cache_key   text        PRIMARY KEY,
+  calc_id     uuid        NOT NULL,
+  params_ts   timestamptz,
+  created_at  timestamptz NOT NULL DEFAULT now()
+);
+
+-- trafienie w cache: nowy calc_id (etap 00) → calc_id, którego wyniki leżą w tabelach output
+CREATE TABLE IF NOT EXISTS output.calc_alias (
+  calc_id     uuid        PRIMARY KEY,
+  alias_of    uuid        NOT NULL,
+  job_id      text,
+  params_ts   timestamptz,
+  cache_key   text        NOT NULL,
+  created_at  timestamptz NOT NULL DEFAULT now()
+);
+
 -- (OPCJONALNIE) unikalność najnowszego snapshotu CALC per calc_id
 -- jeśli w 06_validate robisz UPSERT po calc_id:
 -- CREATE UNIQUE INDEX IF NOT EXISTS uq_health_service_calcid
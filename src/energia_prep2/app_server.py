@@ -10,8 +10,12 @@ from starlette.responses import RedirectResponse
 from starlette.routing import Mount, Route
 from starlette.middleware.cors import CORSMiddleware
 
-from energia_prep2.health_api import app as health_app
-from energia_prep2.tasks.params_api import app as params_app, ensure_columns_from_config
+from energia_prep2.health_api import app as health_app, close_pool as close_health_pool
+from energia_prep2.tasks.params_api import (
+    app as params_app,
+    close_pool as close_params_pool,
+    startup_bootstrap as params_startup,
+)
 
 # ── root logging (spójny format z pipeline)
 if not logging.getLogger().handlers:
@@ -27,13 +31,10 @@ def _redirect_to_health_slash(request):
 @asynccontextmanager
 async def lifespan(app: Starlette):
     # Starlette nie odpala startup sub-app z Mount(), więc zrobimy ensure tutaj.
-    try:
-        ensure_columns_from_config()
-        log.info("app_server: ensured columns from config (startup)")
-    except Exception as e:
-        log.warning("app_server: ensure_columns_from_config() failed: %s", e)
+    params_startup()
     yield
-    # tu ewentualny shutdown
+    await close_health_pool()
+    close_params_pool()
 
 app = Starlette(
     routes=[
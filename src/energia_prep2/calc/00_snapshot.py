@@ -263,29 +263,40 @@ def _get_first(d: Mapping[str, Any], *keys: str, default=None):
 # RAW → output.snapshot.raw
 # ─────────────────────────────────────────────────────────────────────────────
 
-async def _table_exists(con: psycopg.AsyncConnection, fq_table: str) -> bool:
-    async with con.cursor() as cur:
-        await cur.execute("SELECT to_regclass(%s) AS reg", (fq_table,))
-        row = await cur.fetchone()
-        return bool(row and row["reg"])
-
 async def dump_params_snapshot(con: psycopg.AsyncConnection, *, calc_id, params_ts) -> int:
     con.row_factory = dict_row
     total_saved = 0
     raw: Dict[str, Any] = {}
 
-    for tbl in PARAM_TABLES:
-        if not await _table_exists(con, tbl):
-            log.error("[00/SNAPSHOT] Brak tabeli: %s", tbl)
-            continue
-        async with con.cursor() as cur:
-            await cur.execute(f"SELECT * FROM {tbl} ORDER BY updated_at DESC NULLS LAST LIMIT 1")
+    # Istnienie wszystkich tabel — jedno zapytanie zamiast 12 × to_regclass
+    async with con.cursor() as cur:
+        await cur.execute(
+            "SELECT t AS tbl, to_regclass(t) IS NOT NULL AS ok FROM unnest(%s::text[]) AS t",
+            (PARAM_TABLES,),
+        )
+        exists = {r["tbl"]: r["ok"] for r in await cur.fetchall()}
+
+    # Ostatnie rekordy — SELECT-y wysłane w jednym pipeline (jeden RTT)
+    pending: List[Tuple[str, Any]] = []
+    try:
+        async with con.pipeline():
+            for tbl in PARAM_TABLES:
+                if not exists.get(tbl):
+                    log.error("[00/SNAPSHOT] Brak tabeli: %s", tbl)
+                    continue
+                cur = con.cursor()
+                pending.append((tbl, cur))
+                await cur.execute(f"SELECT * FROM {tbl} ORDER BY updated_at DESC NULLS LAST LIMIT 1")
+        for tbl, cur in pending:
             row = await cur.fetchone()
             if row is None:
                 log.error("[00/SNAPSHOT] Pusta tabela: %s", tbl)
                 continue
             raw[tbl.split(".")[-1]] = row
             total_saved += 1
+    finally:
+        for _, cur in pending:
+            await cur.close()
 
     async with con.cursor() as cur:
         await cur.execute("""
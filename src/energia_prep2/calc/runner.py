@@ -3,13 +3,20 @@
 
 from __future__ import annotations
 
+import asyncio
+import functools
+import hashlib
+import json
 import logging
+import os
+from numbers import Number
 from time import perf_counter
 from typing import Any, Dict, Sequence
 from types import ModuleType            # NEW (opcjonalnie)
 import uuid as _uuid
 import importlib                        # NEW (jeśli używasz importlib.import_module)
 import importlib.util
+import numpy as np
 import psycopg                          # NEW (dla AsyncConnection w type hint)
 import sys
 from pathlib import Path
@@ -40,11 +47,36 @@ def _load_stage_module(filename: str, safe_modname: str) -> Any:
     spec.loader.exec_module(mod)  # type: ignore[attr-defined]
     return mod
 
+# Pliki etapów → nazwy modułów (kolejność = kolejność etapów)
+_STAGE_FILES: Dict[str, tuple[str, str]] = {
+    "snapshot": ("00_snapshot.py", "energia_prep2.calc.stage00_snapshot"),
+    "ingest":   ("01_ingest.py",   "energia_prep2.calc.stage01_ingest"),
+    "proposer": ("02_proposer.py", "energia_prep2.calc.stage02_proposer"),
+    "commit":   ("03_commit.py",   "energia_prep2.calc.stage03_commit"),
+    "pricing":  ("04_pricing.py",  "energia_prep2.calc.stage04_pricing"),
+    "persist":  ("05_persist.py",  "energia_prep2.calc.stage05_persist"),
+    "validate": ("06_validate.py", "energia_prep2.calc.stage06_validate"),
+}
+
+@functools.cache
+def _stage_modules() -> Dict[str, ModuleType]:
+    """
+    Ładuje moduły etapów RAZ na proces (pierwsze wywołanie) i trzyma je w cache.
+    Kolejne joby nie płacą już za stat + exec_module siedmiu plików.
+    Błąd ładowania nie jest cache'owany — kolejny job spróbuje ponownie.
+    """
+    return {key: _load_stage_module(fn, modname) for key, (fn, modname) in _STAGE_FILES.items()}
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Preflight — pomocnicze walidatory kontraktu danych (dopasowane do 01_ingest)
 # ─────────────────────────────────────────────────────────────────────────────
+_SEQ_TYPES = (list, tuple, np.ndarray)
+
 def _is_seq(x) -> bool:
-    return isinstance(x, (list, tuple)) or (hasattr(x, "__len__") and hasattr(x, "__getitem__"))
+    # typowe przypadki (list/tuple/ndarray) bez hasattr; reszta (np. Series) — sonda
+    if isinstance(x, _SEQ_TYPES):
+        return True
+    return hasattr(x, "__len__") and hasattr(x, "__getitem__")
 
 def _len_of(x) -> int:
     try:
@@ -53,235 +85,418 @@ def _len_of(x) -> int:
         return 0
 
 def _require_keys(stage: str, obj: Dict[str, Any], keys: Sequence[str]) -> None:
-    miss = [k for k in keys if k not in obj]
-    if miss:
+    # set.difference(dict) sprawdza przynależność w C; listę (w kolejności
+    # deklaracji) budujemy dopiero na ścieżce błędu
+    missing = set(keys).difference(obj)
+    if missing:
+        miss = [k for k in keys if k in missing]
         raise RuntimeError(f"[PREFLIGHT][{stage}] Brak wymaganych kluczy: {', '.join(miss)}")
 
-def _require_arrays(stage: str, obj: Dict[str, Any], keys: Sequence[str], n: int) -> None:
-    bad = []
-    for k in keys:
-        v = obj.get(k)
-        if not _is_seq(v) or _len_of(v) != n:
-            bad.append(k)
-    if bad:
-        raise RuntimeError(f"[PREFLIGHT][{stage}] Pola muszą mieć długość N={n}: {', '.join(bad)}")
-
-def _require_nonneg(stage: str, obj: Dict[str, Any], keys: Sequence[str]) -> None:
-    neg = []
-    for k in keys:
-        v = obj.get(k)
-        if _is_seq(v):
-            try:
-                if any((x is not None and float(x) < -1e-9) for x in v):
-                    neg.append(k)
-            except Exception:
-                # jeżeli nie da się zrzutować, pomiń (to preflight, nie parser)
-                pass
-        else:
-            try:
-                if v is not None and float(v) < -1e-9:
-                    neg.append(k)
-            except Exception:
-                pass
+# Rodzaje pól w specyfikacji preflightu (spec = ((klucz, rodzaj), ...)):
+#   "key"          — tylko obecność klucza,
+#   "scalar"       — obecny, twardy skalar liczbowy (bez kontenerów/ndarray/Series),
+#   "array"        — obecny, długość N,
+#   "array_nonneg" — jak "array" + brak wartości ujemnych,
+#   "opt_array"    — jeśli obecny, to długość N,
+#   "opt_cap"      — jeśli obecny, to skalar albo długość N.
+_MISSING = object()
+_OPTIONAL_KINDS = frozenset(("opt_array", "opt_cap"))
+
+def _is_scalar(v: Any) -> bool:
+    """Twardy SKALAR liczbowy (brak kontenerów/ndarray/Series)."""
+    if isinstance(v, (list, tuple)):
+        return False
+    if getattr(v, "shape", None) not in (None, ()):
+        return False
+    if hasattr(v, "__len__") and not isinstance(v, (str, bytes)):
+        try:
+            _ = len(v)
+            return False
+        except TypeError:
+            pass
+    return isinstance(v, Number)
+
+def _has_neg(v: Any) -> bool:
+    if _is_seq(v):
+        # Szybka ścieżka: jedna pętla w C (None → NaN, a NaN < x == False)
+        try:
+            arr = np.asarray(v, dtype=np.float64)
+        except (TypeError, ValueError):
+            arr = None
+        if arr is not None:
+            return bool((arr < -1e-9).any())
+        # Mieszane typy — stara pętla element po elemencie
+        try:
+            return any((x is not None and float(x) < -1e-9) for x in v)
+        except Exception:
+            # jeżeli nie da się zrzutować, pomiń (to preflight, nie parser)
+            return False
+    try:
+        return v is not None and float(v) < -1e-9
+    except Exception:
+        return False
+
+def _validate(stage: str, obj: Dict[str, Any], spec: Sequence[tuple[str, str]], n: int) -> None:
+    """
+    Jedno przejście po `spec`: jeden `obj.get` na klucz, klasyfikacja wg rodzaju.
+    Błędy zgłaszane w kolejności: brak kluczy → długości → skalary → capy → ujemne.
+    """
+    miss: list[str] = []
+    bad_len: list[str] = []
+    bad_scalar: list[str] = []
+    bad_cap: list[str] = []
+    neg: list[str] = []
+    for k, kind in spec:
+        v = obj.get(k, _MISSING)
+        if v is _MISSING:
+            if kind not in _OPTIONAL_KINDS:
+                miss.append(k)
+            continue
+        if kind == "key":
+            continue
+        if kind == "scalar":
+            if not _is_scalar(v):
+                bad_scalar.append(k)
+            continue
+        if kind == "opt_cap":
+            # skalar (brak len() / str / 0-d) albo długość N
+            if not hasattr(v, "__len__") or isinstance(v, (str, bytes)) or getattr(v, "shape", None) == ():
+                continue
+            if _len_of(v) != n:
+                bad_cap.append(k)
+            continue
+        # "array" / "array_nonneg" / "opt_array" — jeden len(); brak len() → TypeError → błąd
+        try:
+            ok = len(v) == n
+        except TypeError:
+            ok = False
+        if not ok:
+            bad_len.append(k)
+        elif kind == "array_nonneg" and _has_neg(v):
+            neg.append(k)
+    if miss:
+        raise RuntimeError(f"[PREFLIGHT][{stage}] Brak wymaganych kluczy: {', '.join(miss)}")
+    if bad_len:
+        raise RuntimeError(f"[PREFLIGHT][{stage}] Pola muszą mieć długość N={n}: {', '.join(bad_len)}")
+    if bad_scalar:
+        raise RuntimeError(f"[PREFLIGHT][{stage}] Pola muszą być skalarami: {', '.join(bad_scalar)}")
+    if bad_cap:
+        raise RuntimeError(
+            f"[PREFLIGHT][{stage}] Pola muszą być skalarem albo długości N={n}: {', '.join(bad_cap)}")
     if neg:
         raise RuntimeError(f"[PREFLIGHT][{stage}] Znaleziono wartości ujemne w: {', '.join(neg)}")
 
-def _require_scalars(stage: str, obj: Dict[str, Any], keys: Sequence[str]) -> None:
-    """Egzekwuje twarde SKALARY (brak kontenerów/ndarray/Series)."""
-    from numbers import Number
-    bad = []
-    for k in keys:
-        if k not in obj:
-            bad.append(k); continue
-        v = obj.get(k)
-        if isinstance(v, (list, tuple)):
-            bad.append(k); continue
-        if getattr(v, "shape", None) not in (None, ()):
-            bad.append(k); continue
-        if hasattr(v, "__len__") and not isinstance(v, (str, bytes)):
-            try:
-                _ = len(v)
-                bad.append(k); continue
-            except TypeError:
-                pass
-        if not isinstance(v, Number):
-            bad.append(k); continue
-    if bad:
-        raise RuntimeError(f"[PREFLIGHT][{stage}] Pola muszą być skalarami: {', '.join(bad)}")
-
-def _require_prices(stage: str, H: Dict[str, Any], n: int) -> None:
-    need = ("price_import_pln_mwh", "price_export_pln_mwh")
-    _require_keys(stage, H, need)
-    _require_arrays(stage, H, need, n)
-
 # ─────────────────────────────────────────────────────────────────────────────
-# Preflight: checki przy poszczególnych etapach (zgrane z aktualnym 01_ingest)
+# Preflight: specyfikacje kontraktu przy poszczególnych etapach (stałe modułu)
 # ─────────────────────────────────────────────────────────────────────────────
-def _preflight_after_ingest(H: Dict[str, Any]) -> None:
-    _require_keys("00.after_ingest", H, ["ts_hour", "N", "calc_id", "params_ts"])
-    n = int(H["N"])
-    if n <= 0:
-        raise RuntimeError("[PREFLIGHT][00.after_ingest] N==0 — brak godzin do obliczeń")
-    _require_arrays("00.after_ingest", H, ["ts_hour"], n)
+_AFTER_INGEST_KEYS = ("ts_hour", "N", "calc_id", "params_ts")
+_BEFORE_PRICING_KEYS = ("calc_id", "params_ts", "ts_hour", "N")
+
+_SPEC_AFTER_INGEST_H = (
+    ("ts_hour", "array"),
     # Skalary wg nowych nazw w 01_ingest:
-    _require_scalars(
-        "00.after_ingest",
-        H,
-        ["emax_arbi_mwh", "eta_ch_frac", "eta_dis_frac", "bess_lambda_h_frac"],
-    )
+    ("emax_arbi_mwh", "scalar"),
+    ("eta_ch_frac", "scalar"),
+    ("eta_dis_frac", "scalar"),
+    ("bess_lambda_h_frac", "scalar"),
     # Dopuszczalne opcjonalne szeregi (jeżeli występują)
-    maybe = [k for k in ("e_surplus_mwh", "e_deficit_mwh", "surplus_net_mwh", "p_load_net_mwh") if k in H]
-    if maybe:
-        _require_arrays("00.after_ingest", H, maybe, n)
-    log.info("[PREFLIGHT] 00.after_ingest OK (N=%d)", n)
-
-def _preflight_before_proposer(H: Dict[str, Any]) -> None:
-    n = int(H["N"])
-    req_scalar = [
-        "base_min_profit_pln_mwh",
-        "soc_low_threshold", "soc_high_threshold",
-        "cycles_per_day",
-        "emax_arbi_mwh",
-    ]
-    _require_keys("01.before_proposer", H, req_scalar)
-    _require_scalars("01.before_proposer", H, req_scalar)
-
-    _require_arrays(
-        "01.before_proposer",
-        H,
-        ["ts_hour", "cap_grid_import_ac_mwh", "cap_grid_export_ac_mwh", "is_work"],
-        n,
-    )
-    # Bonusowe maski nie są obecnie wymagane w H (brak w 01_ingest) — pomijamy.
-    log.info("[PREFLIGHT] 01.before_proposer OK")
-
-def _preflight_after_proposer(H: Dict[str, Any], P: Dict[str, Any]) -> None:
-    n = int(H["N"])
-    keys = ["prop_arbi_ch_from_grid_ac_mwh", "prop_arbi_dis_to_grid_ac_mwh"]
-    _require_keys("01.after_proposer", P, keys)
-    _require_arrays("01.after_proposer", P, keys, n)
-    _require_nonneg("01.after_proposer", P, keys)
-    log.info("[PREFLIGHT] 01.after_proposer OK")
-
-def _preflight_before_commit(H: Dict[str, Any], P: Dict[str, Any]) -> None:
-    n = int(H["N"])
-    _require_arrays("02.before_commit", P,
-                    ["prop_arbi_ch_from_grid_ac_mwh", "prop_arbi_dis_to_grid_ac_mwh"], n)
-
+    ("e_surplus_mwh", "opt_array"),
+    ("e_deficit_mwh", "opt_array"),
+    ("surplus_net_mwh", "opt_array"),
+    ("p_load_net_mwh", "opt_array"),
+)
+
+# Bonusowe maski nie są obecnie wymagane w H (brak w 01_ingest) — pomijamy.
+_SPEC_BEFORE_PROPOSER_H = (
+    ("base_min_profit_pln_mwh", "scalar"),
+    ("soc_low_threshold", "scalar"),
+    ("soc_high_threshold", "scalar"),
+    ("cycles_per_day", "scalar"),
+    ("emax_arbi_mwh", "scalar"),
+    ("ts_hour", "array"),
+    ("cap_grid_import_ac_mwh", "array"),
+    ("cap_grid_export_ac_mwh", "array"),
+    ("is_work", "array"),
+)
+
+_SPEC_AFTER_PROPOSER_P = (
+    ("prop_arbi_ch_from_grid_ac_mwh", "array_nonneg"),
+    ("prop_arbi_dis_to_grid_ac_mwh", "array_nonneg"),
+)
+
+_SPEC_BEFORE_COMMIT_P = (
+    ("prop_arbi_ch_from_grid_ac_mwh", "array"),
+    ("prop_arbi_dis_to_grid_ac_mwh", "array"),
+)
+
+_SPEC_BEFORE_COMMIT_H = (
     # Ceny (nowe nazwy z 01_ingest)
-    _require_prices("02.before_commit", H, n)
-
+    ("price_import_pln_mwh", "array"),
+    ("price_export_pln_mwh", "array"),
     # Opcjonalne capy AC — jeśli są, to skalar lub długość N
-    def _ok_cap(key: str) -> bool:
-        if key not in H:
-            return True
-        v = H.get(key)
-        if not hasattr(v, "__len__") or isinstance(v, (str, bytes)):
-            return True
-        if getattr(v, "shape", None) == ():
-            return True
-        return _len_of(v) == n
-
-    bad = [k for k in ("cap_grid_export_ac_mwh", "cap_grid_import_ac_mwh") if not _ok_cap(k)]
-    if bad:
-        raise RuntimeError(
-            f"[PREFLIGHT][02.before_commit] Pola muszą być skalarem albo długości N={n}: {', '.join(bad)}")
-
-    log.info("[PREFLIGHT] 02.before_commit OK")
+    ("cap_grid_export_ac_mwh", "opt_cap"),
+    ("cap_grid_import_ac_mwh", "opt_cap"),
+)
+
+_SPEC_AFTER_COMMIT_C = (
+    ("e_import_mwh", "array_nonneg"),
+    ("e_export_mwh", "array_nonneg"),
+    ("charge_from_surplus_mwh", "array_nonneg"),
+    ("charge_from_grid_mwh", "array_nonneg"),
+    ("discharge_to_load_mwh", "array_nonneg"),
+    ("discharge_to_grid_mwh", "array_nonneg"),
+    ("soc_arbi_after_idle_mwh", "array_nonneg"),
+)
+
+_SPEC_AFTER_COMMIT_EXPORT_C = (
+    ("export_from_arbi_ac_mwh", "array"),
+    ("export_from_surplus_ac_mwh", "array"),
+)
+
+_SPEC_BEFORE_PERSIST_H = (
+    ("params_ts", "key"),
+    ("calc_id", "key"),
+    ("ts_utc", "array"),
+    ("ts_hour", "array"),  # ts_local niewymagany
+)
+
+_SPEC_BEFORE_PERSIST_P = (
+    ("prop_arbi_ch_from_grid_ac_mwh", "array"),
+    ("prop_arbi_dis_to_grid_ac_mwh", "array"),
+)
+
+_SPEC_BEFORE_PERSIST_C = (
+    ("e_import_mwh", "array"),
+    ("e_export_mwh", "array"),
+)
 
-def _preflight_after_commit(H: Dict[str, Any], C: Dict[str, Any]) -> None:
+# ─────────────────────────────────────────────────────────────────────────────
+# Preflight: checki przy poszczególnych etapach (zgrane z aktualnym 01_ingest)
+# ─────────────────────────────────────────────────────────────────────────────
+def _preflight_after_ingest(H: Dict[str, Any]) -> int:
+    """Zwraca N — jedyne miejsce, gdzie czytamy H["N"]; dalej N idzie argumentem."""
+    _require_keys("00.after_ingest", H, _AFTER_INGEST_KEYS)
     n = int(H["N"])
-    req = ["e_import_mwh", "e_export_mwh",
-           "charge_from_surplus_mwh", "charge_from_grid_mwh",
-           "discharge_to_load_mwh", "discharge_to_grid_mwh",
-           "soc_arbi_after_idle_mwh"]
-    _require_arrays("02.after_commit", C, req, n)
-    _require_nonneg("02.after_commit", C, req)
+    if n <= 0:
+        raise RuntimeError("[PREFLIGHT][00.after_ingest] N==0 — brak godzin do obliczeń")
+    _validate("00.after_ingest", H, _SPEC_AFTER_INGEST_H, n)
+    if log.isEnabledFor(logging.INFO):
+        log.info("[PREFLIGHT] 00.after_ingest OK (N=%d)", n)
+    return n
+
+def _preflight_before_proposer(H: Dict[str, Any], n: int) -> None:
+    _validate("01.before_proposer", H, _SPEC_BEFORE_PROPOSER_H, n)
+    if log.isEnabledFor(logging.INFO):
+        log.info("[PREFLIGHT] 01.before_proposer OK")
+
+def _preflight_after_proposer(H: Dict[str, Any], P: Dict[str, Any], n: int) -> None:
+    _validate("01.after_proposer", P, _SPEC_AFTER_PROPOSER_P, n)
+    if log.isEnabledFor(logging.INFO):
+        log.info("[PREFLIGHT] 01.after_proposer OK")
+
+def _preflight_before_commit(H: Dict[str, Any], P: Dict[str, Any], n: int) -> None:
+    _validate("02.before_commit", P, _SPEC_BEFORE_COMMIT_P, n)
+    _validate("02.before_commit", H, _SPEC_BEFORE_COMMIT_H, n)
+    if log.isEnabledFor(logging.INFO):
+        log.info("[PREFLIGHT] 02.before_commit OK")
+
+def _preflight_after_commit(H: Dict[str, Any], C: Dict[str, Any], n: int) -> None:
+    _validate("02.after_commit", C, _SPEC_AFTER_COMMIT_C, n)
     if "export_from_arbi_ac_mwh" in C and "export_from_surplus_ac_mwh" in C:
-        _require_arrays("02.after_commit", C, ["export_from_arbi_ac_mwh", "export_from_surplus_ac_mwh"], n)
-    log.info("[PREFLIGHT] 02.after_commit OK")
+        _validate("02.after_commit", C, _SPEC_AFTER_COMMIT_EXPORT_C, n)
+    if log.isEnabledFor(logging.INFO):
+        log.info("[PREFLIGHT] 02.after_commit OK")
 
 def _preflight_before_pricing(H: Dict[str, Any], P_params: Dict[str, Any], C: Dict[str, Any]) -> None:
-    _require_keys("03.before_pricing", H, ["calc_id", "params_ts", "ts_hour", "N"])
-    log.info("[PREFLIGHT] 03.before_pricing OK")
+    _require_keys("03.before_pricing", H, _BEFORE_PRICING_KEYS)
+    if log.isEnabledFor(logging.INFO):
+        log.info("[PREFLIGHT] 03.before_pricing OK")
 
-def _preflight_before_persist(H: Dict[str, Any], P: Dict[str, Any], C: Dict[str, Any]) -> None:
-    n = int(H["N"])
-    _require_keys("persist.before", H, ["params_ts", "calc_id"])
-    _require_arrays("persist.before", H, ["ts_utc", "ts_hour"], n)  # ts_local niewymagany
-    _require_arrays("persist.before", P, ["prop_arbi_ch_from_grid_ac_mwh",
-                                          "prop_arbi_dis_to_grid_ac_mwh"], n)
-    _require_arrays("persist.before", C, ["e_import_mwh", "e_export_mwh"], n)
-    log.info("[PREFLIGHT] persist.before OK")
+def _preflight_before_persist(H: Dict[str, Any], P: Dict[str, Any], C: Dict[str, Any], n: int) -> None:
+    _validate("persist.before", H, _SPEC_BEFORE_PERSIST_H, n)
+    _validate("persist.before", P, _SPEC_BEFORE_PERSIST_P, n)
+    _validate("persist.before", C, _SPEC_BEFORE_PERSIST_C, n)
+    if log.isEnabledFor(logging.INFO):
+        log.info("[PREFLIGHT] persist.before OK")
 
 # ─────────────────────────────────────────────────────────────────────────────
 # STATUSY ETAPÓW — jedyny właściciel: runner.py
 # ─────────────────────────────────────────────────────────────────────────────
 TABLE_JOB_STAGE = "output.calc_job_stage"
-_ALLOWED_STAGE = ("00","01","02","03","04","05","06")
-
-async def _ensure_stage_table(con) -> None:
-    async with con.cursor() as cur:
-        await cur.execute(f"""
-        CREATE TABLE IF NOT EXISTS {TABLE_JOB_STAGE} (
-          calc_id     uuid NOT NULL,
-          stage       text NOT NULL,
-          status      text NOT NULL CHECK (status IN ('running','done','failed')),
-          started_at  timestamptz,
-          finished_at timestamptz,
-          error       text,
-          PRIMARY KEY (calc_id, stage)
-        );
-        """)
-        await cur.execute(f"""
-        DO $$
-        BEGIN
-          IF NOT EXISTS (
-            SELECT 1 FROM pg_constraint WHERE conname = 'calc_job_stage_stage_check'
-          ) THEN
-            ALTER TABLE {TABLE_JOB_STAGE}
-              ADD CONSTRAINT calc_job_stage_stage_check
-              CHECK (stage IN ('00','01','02','03','04','05','06'));
-          END IF;
-        END$$;
-        """)
-    await con.commit()
+_ALLOWED_STAGE = frozenset(("00", "01", "02", "03", "04", "05", "06"))
+
+# SQL statusów składany raz (import); wykonywany z prepare=True → serwer
+# trzyma gotowy plan (PREPARE/EXECUTE) zamiast parsować tekst co wywołanie.
+SQL_STAGE_START = f"""
+INSERT INTO {TABLE_JOB_STAGE} (calc_id, stage, status, started_at, finished_at, error)
+VALUES (%s, %s, 'running', now(), NULL, NULL)
+ON CONFLICT (calc_id, stage)
+DO UPDATE SET status='running',
+              started_at=COALESCE({TABLE_JOB_STAGE}.started_at, EXCLUDED.started_at),
+              finished_at=NULL,
+              error=NULL
+"""
+
+SQL_STAGE_DONE = f"""
+UPDATE {TABLE_JOB_STAGE}
+SET status='done', finished_at=now()
+WHERE calc_id=%s AND stage=%s
+"""
+
+SQL_STAGE_ADVANCE = f"""
+WITH prev AS (
+  UPDATE {TABLE_JOB_STAGE}
+  SET status='done', finished_at=now()
+  WHERE calc_id=%s AND stage=%s
+)
+INSERT INTO {TABLE_JOB_STAGE} (calc_id, stage, status, started_at, finished_at, error)
+VALUES (%s, %s, 'running', now(), NULL, NULL)
+ON CONFLICT (calc_id, stage)
+DO UPDATE SET status='running',
+              started_at=COALESCE({TABLE_JOB_STAGE}.started_at, EXCLUDED.started_at),
+              finished_at=NULL,
+              error=NULL
+"""
+
+SQL_STAGE_FAIL = f"""
+UPDATE {TABLE_JOB_STAGE}
+SET status='failed', finished_at=now(), error=%s
+WHERE calc_id=%s AND stage=%s
+"""
 
 async def _stage_start(con, calc_id: str, stage: str) -> None:
     assert stage in _ALLOWED_STAGE
     async with con.cursor() as cur:
-        await cur.execute(f"""
-        INSERT INTO {TABLE_JOB_STAGE} (calc_id, stage, status, started_at, finished_at, error)
-        VALUES (%s, %s, 'running', now(), NULL, NULL)
-        ON CONFLICT (calc_id, stage)
-        DO UPDATE SET status='running',
-                      started_at=COALESCE({TABLE_JOB_STAGE}.started_at, EXCLUDED.started_at),
-                      finished_at=NULL,
-                      error=NULL
-        """, (calc_id, stage))
+        await cur.execute(SQL_STAGE_START, (calc_id, stage), prepare=True)
     await con.commit()
 
+async def _stage_begin(con, calc_id: str) -> None:
+    """Start etapu 00 (tabela statusów pochodzi z bootstrap SQL)."""
+    await _stage_start(con, calc_id, "00")
+
 async def _stage_done(con, calc_id: str, stage: str) -> None:
     assert stage in _ALLOWED_STAGE
     async with con.cursor() as cur:
-        await cur.execute(f"""
-        UPDATE {TABLE_JOB_STAGE}
-        SET status='done', finished_at=now()
-        WHERE calc_id=%s AND stage=%s
-        """, (calc_id, stage))
+        await cur.execute(SQL_STAGE_DONE, (calc_id, stage), prepare=True)
     await con.commit()
 
+async def _stage_advance(con, calc_id: str, *, done: str, start: str) -> None:
+    """
+    Przejście między etapami w JEDNEJ instrukcji (i jednym commit):
+    `done` → 'done' oraz `start` → 'running' (UPSERT jak w _stage_start).
+    Zastępuje parę _stage_done + _stage_start na granicy etapów (2 RTT → 1).
+    """
+    assert done in _ALLOWED_STAGE and start in _ALLOWED_STAGE
+    async with con.cursor() as cur:
+        await cur.execute(SQL_STAGE_ADVANCE, (calc_id, done, calc_id, start), prepare=True)
+    await con.commit()
+
+async def _advance_with_preflight(con, calc_id: str, *, done: str, start: str, preflight, args: tuple) -> None:
+    """
+    _stage_advance (RTT) równolegle z preflightem (CPU, w wątku).
+    Czekamy na OBA zadania przed zgłoszeniem błędu — inaczej _stage_fail mógłby
+    wyprzedzić advance na tym samym połączeniu i etap zostałby 'running'.
+    """
+    results = await asyncio.gather(
+        _stage_advance(con, calc_id, done=done, start=start),
+        asyncio.to_thread(preflight, *args),
+        return_exceptions=True,
+    )
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+
 async def _stage_fail(con, calc_id: str, stage: str, error: str | None) -> None:
     assert stage in _ALLOWED_STAGE
     err = (error or "").strip()
     if len(err) > 8000:
         err = err[:8000] + "…"
     async with con.cursor() as cur:
-        await cur.execute(f"""
-        UPDATE {TABLE_JOB_STAGE}
-        SET status='failed', finished_at=now(), error=%s
-        WHERE calc_id=%s AND stage=%s
-        """, (err, calc_id, stage))
+        await cur.execute(SQL_STAGE_FAIL, (err, calc_id, stage), prepare=True)
+    await con.commit()
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CACHE — pominięcie etapów 01..06 dla identycznych wejść
+# ─────────────────────────────────────────────────────────────────────────────
+CALC_CACHE = os.getenv("CALC_CACHE", "0").strip().lower() not in ("0", "false", "no")
+TABLE_CALC_CACHE = "output.calc_cache"
+TABLE_CALC_ALIAS = "output.calc_alias"
+
+# Tanie „wersje” wejść czytanych przez 01_ingest: liczność + ostatnia zmiana
+# (date_dim nie ma updated_at → zakres osi czasu po PK)
+SQL_INPUTS_VERSION = """
+SELECT
+  (SELECT row(count(*), min(ts_utc), max(ts_utc))::text FROM input.date_dim)     AS date_dim,
+  (SELECT row(count(*), max(updated_at))::text          FROM input.konsumpcja)    AS konsumpcja,
+  (SELECT row(count(*), max(updated_at))::text          FROM input.produkcja)     AS produkcja,
+  (SELECT row(count(*), max(updated_at))::text          FROM input.ceny_godzinowe) AS ceny
+"""
+
+# Trafienie tylko, gdy kalkulacja z cache jest wciąż OSTATNIĄ utrwaloną (05 done),
+# bo 05_persist nadpisuje tabele wynikowe.
+SQL_CACHE_LOOKUP = f"""
+SELECT c.calc_id::text AS calc_id
+FROM {TABLE_CALC_CACHE} c
+WHERE c.cache_key = %s
+  AND c.calc_id = (
+    SELECT s.calc_id FROM {TABLE_JOB_STAGE} s
+    WHERE s.stage = '05' AND s.status = 'done'
+    ORDER BY s.finished_at DESC NULLS LAST
+    LIMIT 1
+  )
+"""
+
+SQL_CACHE_ALIAS = f"""
+INSERT INTO {TABLE_CALC_ALIAS} (calc_id, alias_of, job_id, params_ts, cache_key, created_at)
+VALUES (%s, %s, %s, %s, %s, now())
+"""
+
+SQL_CACHE_STORE = f"""
+INSERT INTO {TABLE_CALC_CACHE} (cache_key, calc_id, params_ts, created_at)
+VALUES (%s, %s, %s, now())
+ON CONFLICT (cache_key) DO UPDATE
+  SET calc_id = EXCLUDED.calc_id,
+      params_ts = EXCLUDED.params_ts,
+      created_at = EXCLUDED.created_at
+"""
+
+@functools.cache
+def _code_fingerprint() -> str:
+    """Hash źródeł runnera i plików etapów — zmiana kodu unieważnia cache."""
+    here = Path(__file__).resolve().parent
+    h = hashlib.blake2b(Path(__file__).read_bytes(), digest_size=16)
+    for fn, _ in _STAGE_FILES.values():
+        h.update((here / fn).read_bytes())
+    return h.hexdigest()
+
+async def _calc_cache_key(con, norm: Dict[str, Any]) -> str:
+    """Klucz przyczynowy: znormalizowane parametry (bez __raw) + wejścia + kod."""
+    async with con.cursor() as cur:
+        await cur.execute(SQL_INPUTS_VERSION)
+        inputs = await cur.fetchone()
+    material = {
+        "code": _code_fingerprint(),
+        "norm": {k: v for k, v in norm.items() if k != "__raw"},
+        "inputs": list(inputs.values()) if isinstance(inputs, dict) else list(inputs or ()),
+    }
+    blob = json.dumps(material, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+async def _calc_cache_lookup(con, cache_key: str) -> str | None:
+    async with con.cursor() as cur:
+        await cur.execute(SQL_CACHE_LOOKUP, (cache_key,))
+        row = await cur.fetchone()
+    if not row:
+        return None
+    return row["calc_id"] if isinstance(row, dict) else row[0]
+
+async def _calc_cache_alias(con, calc_id: str, alias_of: str, *, job_id, params_ts, cache_key: str) -> None:
+    async with con.cursor() as cur:
+        await cur.execute(SQL_CACHE_ALIAS, (calc_id, alias_of, str(job_id), params_ts, cache_key))
+
+async def _calc_cache_store(con, cache_key: str, calc_id: str, params_ts) -> None:
+    async with con.cursor() as cur:
+        await cur.execute(SQL_CACHE_STORE, (cache_key, calc_id, params_ts))
     await con.commit()
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -297,20 +512,22 @@ async def run_calc(con: psycopg.AsyncConnection, *, job_id: str, params_ts) -> s
     calc_id_str = str(calc_id)
     log.info("[RUN] start calc_id=%s job_id=%s params_ts=%s", calc_id_str, job_id, params_ts)
 
-    # 2) Załaduj moduły etapów
-    snapshot_mod = _load_stage_module("00_snapshot.py", "energia_prep2.calc.stage00_snapshot")
-    ingest_mod = _load_stage_module("01_ingest.py", "energia_prep2.calc.stage01_ingest")
-    proposer_mod = _load_stage_module("02_proposer.py", "energia_prep2.calc.stage02_proposer")
-    commit_mod = _load_stage_module("03_commit.py", "energia_prep2.calc.stage03_commit")
-    pricing_mod = _load_stage_module("04_pricing.py", "energia_prep2.calc.stage04_pricing")
-    persist_mod = _load_stage_module("05_persist.py", "energia_prep2.calc.stage05_persist")
-    validate_mod = _load_stage_module("06_validate.py", "energia_prep2.calc.stage06_validate")
+    # 2) Moduły etapów (ładowane raz na proces — patrz _stage_modules)
+    mods = _stage_modules()
+    snapshot_mod = mods["snapshot"]
+    ingest_mod = mods["ingest"]
+    proposer_mod = mods["proposer"]
+    commit_mod = mods["commit"]
+    pricing_mod = mods["pricing"]
+    persist_mod = mods["persist"]
+    validate_mod = mods["validate"]
 
     # Pomocnicze bufory wyników pomiędzy etapami
     H_buf: Dict[str, Any] = {}
     P_buf: Dict[str, Any] = {}
     C_buf: Dict[str, Any] = {}
     pricing_rows: Sequence[Dict[str, Any]] = ()
+    n = 0  # N (liczba godzin) — ustalane raz, po etapie 01
 
     # PERF – całość
     t_all0 = perf_counter()
@@ -318,29 +535,48 @@ async def run_calc(con: psycopg.AsyncConnection, *, job_id: str, params_ts) -> s
     # 3) [00] Snapshot + konsolidacja parametrów
     t_s0 = perf_counter()
     try:
-        await _stage_start(con, calc_id_str, "00")
-        log.info("[STAGE 00] running…")
+        await _stage_begin(con, calc_id_str)
+        log.debug("[STAGE 00] running…")
         await snapshot_mod.dump_params_snapshot(con, calc_id=calc_id_str, params_ts=params_ts)
-        await snapshot_mod.build_params_snapshot_consolidated(con, calc_id=calc_id_str, params_ts=params_ts)
-        await _stage_done(con, calc_id_str, "00")
-        log.info("[STAGE 00] ok (%.0f ms)", (perf_counter() - t_s0) * 1000.0)
+        norm = await snapshot_mod.build_params_snapshot_consolidated(con, calc_id=calc_id_str, params_ts=params_ts)
     except Exception as e:
         log.exception("[STAGE 00] failed: %s", e)
         await _stage_fail(con, calc_id_str, "00", str(e))
         raise
     t_s1 = perf_counter()
 
+    # 3b) Cache (CALC_CACHE=1) — identyczne wejścia jak w ostatnim utrwalonym biegu → pomijamy 01..06;
+    #     nowy calc_id zostaje jawnie zapisany jako alias kalkulacji, której wyniki są w output
+    cache_key: str | None = None
+    if CALC_CACHE:
+        cached: str | None = None
+        try:
+            # savepoint: błąd cache nie może unieważnić niezacommitowanego etapu 00
+            async with con.transaction():
+                cache_key = await _calc_cache_key(con, norm)
+                cached = await _calc_cache_lookup(con, cache_key)
+                if cached:
+                    await _calc_cache_alias(con, calc_id_str, cached,
+                                            job_id=job_id, params_ts=params_ts, cache_key=cache_key)
+        except Exception as e:
+            log.warning("[CACHE] pominięty (lookup): %s", e)
+            cache_key, cached = None, None
+        if cached:
+            await _stage_done(con, calc_id_str, "00")
+            log.info("[CACHE] hit key=%s → calc_id=%s alias_of=%s; pomijam etapy 01..06 (%.0f ms)",
+                     cache_key, calc_id_str, cached, (perf_counter() - t_all0) * 1000.0)
+            log.info("[RUN] done (cache) calc_id=%s job_id=%s", calc_id_str, job_id)
+            return calc_id_str
+
     # 4) [01] Ingest (H)
     t00 = perf_counter()
     try:
-        await _stage_start(con, calc_id_str, "01")
-        log.info("[STAGE 01] running…")
+        await _stage_advance(con, calc_id_str, done="00", start="01")
+        log.debug("[STAGE 01] running…")
         H_buf = await ingest_mod.run(con, calc_id=calc_id, params_ts=params_ts)
         if "N" not in H_buf:
             H_buf["N"] = len(H_buf.get("ts_hour", []) or [])
-        _preflight_after_ingest(H_buf)
-        await _stage_done(con, calc_id_str, "01")
-        log.info("[STAGE 01] ok (%.0f ms)", (perf_counter() - t00) * 1000.0)
+        n = _preflight_after_ingest(H_buf)
     except Exception as e:
         log.exception("[STAGE 01] failed: %s", e)
         await _stage_fail(con, calc_id_str, "01", str(e))
@@ -350,13 +586,12 @@ async def run_calc(con: psycopg.AsyncConnection, *, job_id: str, params_ts) -> s
     # 5) [02] Proposer (P)
     t10 = perf_counter()
     try:
-        await _stage_start(con, calc_id_str, "02")
-        log.info("[STAGE 02] running…")
-        _preflight_before_proposer(H_buf)
+        # preflight (CPU) w wątku, równolegle z zapisem statusu (RTT)
+        await _advance_with_preflight(con, calc_id_str, done="01", start="02",
+                                      preflight=_preflight_before_proposer, args=(H_buf, n))
+        log.debug("[STAGE 02] running…")
         P_buf = proposer_mod.run(H_buf, {})
-        _preflight_after_proposer(H_buf, P_buf)
-        await _stage_done(con, calc_id_str, "02")
-        log.info("[STAGE 02] ok (%.0f ms)", (perf_counter() - t10) * 1000.0)
+        _preflight_after_proposer(H_buf, P_buf, n)
     except Exception as e:
         log.exception("[STAGE 02] failed: %s", e)
         await _stage_fail(con, calc_id_str, "02", str(e))
@@ -366,13 +601,11 @@ async def run_calc(con: psycopg.AsyncConnection, *, job_id: str, params_ts) -> s
     # 6) [03] Commit (C)
     t20 = perf_counter()
     try:
-        await _stage_start(con, calc_id_str, "03")
-        log.info("[STAGE 03] running…")
-        _preflight_before_commit(H_buf, P_buf)
+        await _advance_with_preflight(con, calc_id_str, done="02", start="03",
+                                      preflight=_preflight_before_commit, args=(H_buf, P_buf, n))
+        log.debug("[STAGE 03] running…")
         C_buf = commit_mod.run(H_buf, P_buf)
-        _preflight_after_commit(H_buf, C_buf)
-        await _stage_done(con, calc_id_str, "03")
-        log.info("[STAGE 03] ok (%.0f ms)", (perf_counter() - t20) * 1000.0)
+        _preflight_after_commit(H_buf, C_buf, n)
     except Exception as e:
         log.exception("[STAGE 03] failed: %s", e)
         await _stage_fail(con, calc_id_str, "03", str(e))
@@ -382,14 +615,12 @@ async def run_calc(con: psycopg.AsyncConnection, *, job_id: str, params_ts) -> s
     # 7) [04] Pricing (wiersze)
     t30p = perf_counter()
     try:
-        await _stage_start(con, calc_id_str, "04")
-        log.info("[STAGE 04] running…")
+        await _stage_advance(con, calc_id_str, done="03", start="04")
+        log.debug("[STAGE 04] running…")
         # Normy pod pricing bierzemy z 00 (konsolidat)
         P_params: Dict[str, Any] = await snapshot_mod.get_consolidated_norm(con, calc_id=calc_id_str)
         _preflight_before_pricing(H_buf, P_params, C_buf)
         pricing_rows = pricing_mod.run(H_buf=H_buf, P_buf=P_params, C_buf=C_buf)
-        await _stage_done(con, calc_id_str, "04")
-        log.info("[STAGE 04] ok (%.0f ms)", (perf_counter() - t30p) * 1000.0)
     except Exception as e:
         log.exception("[STAGE 04] failed: %s", e)
         await _stage_fail(con, calc_id_str, "04", str(e))
@@ -399,14 +630,12 @@ async def run_calc(con: psycopg.AsyncConnection, *, job_id: str, params_ts) -> s
     # 8) [05] Persist (01..04) — jedno wywołanie
     t30 = perf_counter()
     try:
-        await _stage_start(con, calc_id_str, "05")
-        log.info("[STAGE 05] running…")
-        _preflight_before_persist(H_buf, P_buf, C_buf)
+        await _advance_with_preflight(con, calc_id_str, done="04", start="05",
+                                      preflight=_preflight_before_persist, args=(H_buf, P_buf, C_buf, n))
+        log.debug("[STAGE 05] running…")
         await persist_mod.persist_all(
             con, H_buf, P_buf, C_buf, pricing_rows, params_ts=params_ts, truncate=True
         )
-        await _stage_done(con, calc_id_str, "05")
-        log.info("[STAGE 05] ok (%.0f ms)", (perf_counter() - t30) * 1000.0)
     except Exception as e:
         log.exception("[STAGE 05] failed: %s", e)
         await _stage_fail(con, calc_id_str, "05", str(e))
@@ -416,31 +645,41 @@ async def run_calc(con: psycopg.AsyncConnection, *, job_id: str, params_ts) -> s
     # 9) [06] Validate
     t_v0 = perf_counter()
     try:
-        await _stage_start(con, calc_id_str, "06")
-        log.info("[STAGE 06] running…")
+        await _stage_advance(con, calc_id_str, done="05", start="06")
+        log.debug("[STAGE 06] running…")
         await validate_mod.run(con, params_ts, calc_id)
         await _stage_done(con, calc_id_str, "06")
-        log.info("[STAGE 06] ok (%.0f ms)", (perf_counter() - t_v0) * 1000.0)
     except Exception as e:
         log.exception("[STAGE 06] failed: %s", e)
         await _stage_fail(con, calc_id_str, "06", str(e))
         raise
     t_v1 = perf_counter()
 
-    # 10) PERF – zbiorczo
+    if cache_key is not None:
+        try:
+            await _calc_cache_store(con, cache_key, calc_id_str, params_ts)
+        except Exception as e:
+            log.warning("[CACHE] nie zapisano klucza %s: %s", cache_key, e)
+            await con.rollback()
+
+    # 10) PERF – zbiorczo (jedyny wpis z czasami etapów; dict także w `extra`)
     t_all1 = perf_counter()
-    log.info(
-        "[PERF] 00_snapshot=%.0f ms | 01_ingest=%.0f ms | 02_proposer=%.0f ms | 03_commit=%.0f ms | "
-        "04_pricing=%.0f ms | 05_persist=%.0f ms | 06_validate=%.0f ms | total=%.0f ms",
-        (t_s1 - t_s0) * 1000.0,  # 00_snapshot
-        (t01 - t00) * 1000.0,    # 01_ingest
-        (t11 - t10) * 1000.0,    # 02_proposer
-        (t21 - t20) * 1000.0,    # 03_commit
-        (t31p - t30p) * 1000.0,  # 04_pricing
-        (t31 - t30) * 1000.0,    # 05_persist
-        (t_v1 - t_v0) * 1000.0,  # 06_validate
-        (t_all1 - t_all0) * 1000.0,
-    )
+    if log.isEnabledFor(logging.INFO):
+        perf = {
+            "00_snapshot": (t_s1 - t_s0) * 1000.0,
+            "01_ingest": (t01 - t00) * 1000.0,
+            "02_proposer": (t11 - t10) * 1000.0,
+            "03_commit": (t21 - t20) * 1000.0,
+            "04_pricing": (t31p - t30p) * 1000.0,
+            "05_persist": (t31 - t30) * 1000.0,
+            "06_validate": (t_v1 - t_v0) * 1000.0,
+            "total": (t_all1 - t_all0) * 1000.0,
+        }
+        log.info(
+            "[PERF] " + " | ".join(f"{k}=%.0f ms" for k in perf),
+            *perf.values(),
+            extra={"perf": perf, "calc_id": calc_id_str},
+        )
 
     log.info("[RUN] done calc_id=%s job_id=%s", calc_id_str, job_id)
     return calc_id_str
@@ -7,6 +7,7 @@ import math
 import time
 import logging
 from contextlib import contextmanager
+from itertools import islice
 from typing import Iterable, Iterator, Any
 
 log = logging.getLogger("energia-prep-2.calc")
@@ -24,16 +25,15 @@ def clamp(x: float, lo: float, hi: float) -> float:
     return max(lo, min(hi, x))
 
 def chunks(iterable: Iterable[Any], size: int) -> Iterator[list[Any]]:
-    buf: list[Any] = []
-    for item in iterable:
-        buf.append(item)
-        if len(buf) >= size:
-            yield buf
-            buf = []
-    if buf:
-        yield buf
+    if size < 1:
+        raise ValueError(f"chunks: size musi być >= 1 (jest {size})")
+    # islice kroi iterator w C — bez append/len na każdy element
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
 
 EPS = 1e-9
 
 def feq(a: float, b: float, eps: float = EPS) -> bool:
-    return abs(a - b) <= eps * max(1.0, abs(a), abs(b))
+    # |a-b| <= eps * max(1, |a|, |b|) — to samo co isclose(rel_tol=eps, abs_tol=eps), ale w C
+    return math.isclose(a, b, rel_tol=eps, abs_tol=eps)
@@ -45,6 +45,11 @@ class Settings(BaseSettings):
     TGE_HISTORY_DAYS: int
     TGE_URL_BASE: str
     TGE_SOURCE: str
+    # Paczka wierszy na jedno zapytanie UPSERT (≈1k — optimum Postgresa; >10k już zwalnia)
+    TGE_UPSERT_PAGE_SIZE: int = Field(default=1000, ge=1)
+    # Pobranie mimo niezmienionych walidatorów HTTP (HEAD w full, 304 w update),
+    # np. po ręcznym czyszczeniu danych
+    TGE_FULL_FORCE: bool = Field(default=False)
 
     # ── API (wymagane)
     API_HOST: str
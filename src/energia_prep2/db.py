@@ -1,13 +1,23 @@
 # src/energia_prep2/db.py
 from __future__ import annotations
 
+import atexit
+import threading
 from contextlib import contextmanager
 from typing import Iterator
 
 import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import ConnectionPool
 
 from .cfg import settings
 
+# Pule połączeń (lazy: tworzone i otwierane przy pierwszym użyciu)
+_POOL_MIN_SIZE = 1
+_POOL_MAX_SIZE = 8
+_POOLS: dict[bool, ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
 
 def _connect_kwargs(app_user: bool = True) -> dict:
     """
@@ -41,24 +51,57 @@ def _connect_kwargs(app_user: bool = True) -> dict:
     )
 
 
+def _get_pool(app_user: bool) -> ConnectionPool:
+    """
+    Zwraca (i przy pierwszym wywołaniu tworzy + otwiera) pulę dla danego użytkownika.
+    Połączenia z puli mają autocommit=True — tak jak dotychczasowe jednorazowe.
+    """
+    pool = _POOLS.get(app_user)
+    if pool is not None:
+        return pool
+    with _POOLS_LOCK:
+        pool = _POOLS.get(app_user)
+        if pool is None:
+            kw = _connect_kwargs(app_user=app_user)
+            # Próbne połączenie: złe hasło / odmowa / zła baza → od razu prawdziwy
+            # OperationalError (jak przed pulą), zamiast PoolTimeout po 30 s
+            psycopg.connect(**kw).close()
+            autocommit = kw.pop("autocommit")
+            pool = ConnectionPool(
+                conninfo=make_conninfo(**kw),
+                kwargs={"autocommit": autocommit},
+                min_size=_POOL_MIN_SIZE,
+                max_size=_POOL_MAX_SIZE,
+                name="energia-prep-2:" + ("app" if app_user else "super"),
+                open=False,
+            )
+            pool.open(wait=False)
+            _POOLS[app_user] = pool
+    return pool
+
+
+@atexit.register
+def close_pools() -> None:
+    """Zamyka wszystkie otwarte pule (wywoływane też automatycznie przy wyjściu)."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.close()
+
+
 @contextmanager
 def get_conn_app() -> Iterator[psycopg.Connection]:
-    """Połączenie jako użytkownik aplikacyjny."""
-    conn = psycopg.connect(**_connect_kwargs(app_user=True))
-    try:
+    """Połączenie (z puli) jako użytkownik aplikacyjny."""
+    with _get_pool(app_user=True).connection() as conn:
         yield conn
-    finally:
-        conn.close()
 
 
 @contextmanager
 def get_conn_super_app() -> Iterator[psycopg.Connection]:
     """
-    Połączenie jako superuser (do operacji wymagających wyższych uprawnień).
+    Połączenie (z puli) jako superuser (do operacji wymagających wyższych uprawnień).
     Wywołujący kod powinien używać warunkowo (np. event trigger).
     """
-    conn = psycopg.connect(**_connect_kwargs(app_user=False))
-    try:
+    with _get_pool(app_user=False).connection() as conn:
         yield conn
-    finally:
-        conn.close()
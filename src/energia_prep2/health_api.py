@@ -1,18 +1,22 @@
 # src/energia_prep2/health_api.py
 from __future__ import annotations
 
+import asyncio
+import functools
 import html
-import json
 import os
 import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import psycopg
 from psycopg import sql
 from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+import orjson
 from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Konfiguracja / ENV
@@ -27,6 +31,14 @@ DB_USER = os.getenv("DB_USER", "voytek")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_SSLMODE = os.getenv("DB_SSLMODE", "prefer")
 DB_TIMEZONE = os.getenv("DB_TIMEZONE", "UTC")  # trzymajmy UTC, prezentację robimy w UI
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+READY_TIMEOUT_S = float(os.getenv("HEALTH_READY_TIMEOUT_S", "0.5"))  # limit dla /ready
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("HEALTH_STATEMENT_TIMEOUT_MS", "3000"))  # górny limit czasu probe'a
+CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "2"))  # s; cache payloadów pod serie probe'ów, 0 = off
+# COUNT(*) = pełny seqscan dużych tabel; domyślnie estymata z pg_class.reltuples
+EXACT_COUNT = os.getenv("HEALTH_EXACT_COUNT", "0").strip().lower() not in ("0", "false", "no")
+SCHEMA_CACHE_TTL = float(os.getenv("HEALTH_SCHEMA_CACHE_TTL", "60"))  # s; 0 = bez cache
 
 # Kluczowe tabele wejściowe (PREP)
 INPUT_TABLES: List[Tuple[str, str]] = [
@@ -41,6 +53,11 @@ PRICES_CANDIDATES: List[Tuple[str, str]] = [
     ("tge", "prices"),            # legacy (jeśli istnieje)
 ]
 
+FORM_TABLE = "params.form_zmienne"
+
+# Wszystko, czego istnienie sprawdzamy — jedno zapytanie/jeden wpis w cache metadanych
+WATCHED_TABLES: List[Tuple[str, str]] = INPUT_TABLES + PRICES_CANDIDATES + [("params", "form_zmienne")]
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Narzędzia
 
@@ -50,12 +67,55 @@ def _dsn() -> str:
         f"user={DB_USER} password={DB_PASSWORD} sslmode={DB_SSLMODE}"
     )
 
-def _connect() -> psycopg.Connection:
-    conn = psycopg.connect(_dsn(), autocommit=True, connect_timeout=8)
-    with conn.cursor() as cur:
-        # Prezentacja timestamptz w wybranej strefie
-        cur.execute(sql.SQL("SET TIME ZONE {}").format(sql.Literal(DB_TIMEZONE)))
-    return conn
+async def _configure(conn: psycopg.AsyncConnection) -> None:
+    # Raz na fizyczne połączenie: limity czasu (wolne COUNT-y nie wieszają probe'ów)
+    # i prezentacja timestamptz w wybranej strefie
+    await conn.execute(
+        sql.SQL(
+            "SET statement_timeout = {st}; SET idle_in_transaction_session_timeout = '5s'; SET TIME ZONE {tz}"
+        ).format(st=sql.Literal(DB_STATEMENT_TIMEOUT_MS), tz=sql.Literal(DB_TIMEZONE))
+    )
+
+_POOL: Optional[AsyncConnectionPool] = None
+_POOL_LOCK = asyncio.Lock()
+
+async def _pool() -> AsyncConnectionPool:
+    """
+    Pula połączeń (lazy: tworzona i otwierana przy pierwszym żądaniu).
+    Startup sub-aplikacji pod Mount() się nie odpala, więc nie otwieramy jej w evencie.
+    """
+    global _POOL
+    if _POOL is None:
+        async with _POOL_LOCK:
+            if _POOL is None:
+                pool = AsyncConnectionPool(
+                    _dsn(),
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_POOL_MAX,
+                    timeout=8,
+                    kwargs={"autocommit": True, "connect_timeout": 8},
+                    configure=_configure,
+                    name="energia-prep-2:health",
+                    open=False,
+                )
+                await pool.open()
+                _POOL = pool
+    return _POOL
+
+async def close_pool() -> None:
+    """Zamyka pulę (wołane z lifespan app_server)."""
+    global _POOL
+    async with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        await pool.close()
+
+@asynccontextmanager
+async def _connect():
+    """Połączenie z puli (oddawane do puli po wyjściu z bloku)."""
+    pool = await _pool()
+    async with pool.connection() as conn:
+        yield conn
 
 def _utcnow() -> datetime:
     return datetime.now(timezone.utc)
@@ -63,34 +123,53 @@ def _utcnow() -> datetime:
 def _utcnow_iso() -> str:
     return _utcnow().isoformat()
 
-def _query_one(conn: psycopg.Connection, sql_text: str, params: Optional[tuple] = None) -> Any:
-    with conn.cursor() as cur:
-        cur.execute(sql_text, params or ())
-        row = cur.fetchone()
+async def _query_one(
+    conn: psycopg.AsyncConnection, sql_text: str, params: Optional[tuple] = None, *, prepare: Optional[bool] = None
+) -> Any:
+    async with conn.cursor() as cur:
+        await cur.execute(sql_text, params or (), prepare=prepare)
+        row = await cur.fetchone()
     return row[0] if row else None
 
-def _query_dicts(conn: psycopg.Connection, sql_text: str, params: Optional[tuple] = None) -> List[dict]:
-    with conn.cursor(row_factory=dict_row) as cur:
-        cur.execute(sql_text, params or ())
-        return list(cur.fetchall())
-
-def _exists_table(conn: psycopg.Connection, schema: str, table: str) -> bool:
-    return bool(
-        _query_one(
-            conn,
-            """
-            SELECT 1
-            FROM information_schema.tables
-            WHERE table_schema=%s AND table_name=%s
-            LIMIT 1
-            """,
-            (schema, table),
-        )
-    )
-
-def _detect_prices_table(conn: psycopg.Connection) -> Optional[str]:
+async def _query_dicts(
+    conn: psycopg.AsyncConnection,
+    sql_text: str,
+    params: Optional[tuple] = None,
+    *,
+    prepare: Optional[bool] = None,
+) -> List[dict]:
+    async with conn.cursor(row_factory=dict_row) as cur:
+        await cur.execute(sql_text, params or (), prepare=prepare)
+        return list(await cur.fetchall())
+
+# Cache metadanych tabel: (nazwy) → (wygasa_o, zbiór istniejących). DDL po starcie łapie TTL.
+_SCHEMA_CACHE: Dict[Tuple[str, ...], Tuple[float, frozenset]] = {}
+
+async def _present_tables(conn: psycopg.AsyncConnection, pairs: List[Tuple[str, str]]) -> frozenset:
+    """Zbiór istniejących 'schema.table' spośród `pairs` (jedno zapytanie, wynik cache'owany na TTL)."""
+    names = tuple(f"{sch}.{tab}" for sch, tab in pairs)
+    hit = _SCHEMA_CACHE.get(names)
+    now = time.monotonic()
+    if hit is not None and now < hit[0]:
+        return hit[1]
+    present = await _query_present_tables(conn, list(names))
+    if SCHEMA_CACHE_TTL > 0:
+        _SCHEMA_CACHE[names] = (now + SCHEMA_CACHE_TTL, present)
+    return present
+
+SQL_PRESENT_TABLES = """
+SELECT table_schema || '.' || table_name AS fq
+FROM information_schema.tables
+WHERE table_schema || '.' || table_name = ANY(%s)
+"""
+
+async def _query_present_tables(conn: psycopg.AsyncConnection, names: List[str]) -> frozenset:
+    rows = await _query_dicts(conn, SQL_PRESENT_TABLES, (names,), prepare=True)
+    return frozenset(r["fq"] for r in rows)
+
+def _pick_prices_table(present: frozenset) -> Optional[str]:
     for sch, tab in PRICES_CANDIDATES:
-        if _exists_table(conn, sch, tab):
+        if f"{sch}.{tab}" in present:
             return f"{sch}.{tab}"
     return None
 
@@ -119,16 +198,29 @@ def _fmt_ts(ts: Optional[datetime]) -> str:
         return "—"
     return ts.replace(microsecond=0).isoformat()
 
+_JSON_OPTS = orjson.OPT_NON_STR_KEYS | orjson.OPT_OMIT_MICROSECONDS
+
 def _safe_json(obj: Any) -> str:
-    def _default(o):
-        if isinstance(o, datetime):
-            return _fmt_ts(o)
-        return str(o)
+    # orjson serializuje datetime natywnie (bez mikrosekund — jak _fmt_ts)
     try:
-        return json.dumps(obj, ensure_ascii=False, default=_default)
+        return orjson.dumps(obj, default=str, option=_JSON_OPTS).decode()
     except Exception:
         return "{}"
 
+# Krótki cache gotowych payloadów: klucz → (znacznik monotonic, wartość). Wyjątki nie są cache'owane.
+_CACHE: Dict[str, Tuple[float, Any]] = {}
+
+async def _cached(key: str, fn, ttl_s: float = CACHE_TTL) -> Any:
+    if ttl_s <= 0:
+        return await fn()
+    hit = _CACHE.get(key)
+    now = time.monotonic()
+    if hit is not None and now - hit[0] < ttl_s:
+        return hit[1]
+    val = await fn()
+    _CACHE[key] = (now, val)
+    return val
+
 def _overall(*statuses: str) -> str:
     if any(s == "down" for s in statuses):
         return "down"
@@ -139,18 +231,18 @@ def _overall(*statuses: str) -> str:
 # ─────────────────────────────────────────────────────────────────────────────
 # Grupy (Overview / wspólne)
 
-def _group_runtime() -> Dict[str, Any]:
+def _group_runtime(checked_at: str) -> Dict[str, Any]:
     return {
         "status": "up",
         "app": f"{APP_NAME} {APP_VERSION}",
-        "checked_at": _utcnow_iso(),
+        "checked_at": checked_at,
     }
 
-def _group_db() -> Dict[str, Any]:
+async def _group_db(checked_at: str) -> Dict[str, Any]:
     started = time.perf_counter()
     try:
-        with _connect() as conn:
-            now_db = _query_one(conn, "SELECT now()")
+        async with _connect() as conn:
+            now_db = await _query_one(conn, "SELECT now()")
         dur = time.perf_counter() - started
         return {
             "status": "up",
@@ -158,7 +250,7 @@ def _group_db() -> Dict[str, Any]:
             "duration_s": round(dur, 4),
             "duration_human": _humanize_seconds(dur),
             "error": None,
-            "checked_at": _utcnow_iso(),
+            "checked_at": checked_at,
         }
     except Exception as e:
         dur = time.perf_counter() - started
@@ -168,15 +260,13 @@ def _group_db() -> Dict[str, Any]:
             "duration_s": round(dur, 4),
             "duration_human": _humanize_seconds(dur),
             "error": str(e),
-            "checked_at": _utcnow_iso(),
+            "checked_at": checked_at,
         }
 
-def _group_schema(conn: psycopg.Connection) -> Dict[str, Any]:
-    missing_tables: List[str] = []
-    for sch, tab in INPUT_TABLES:
-        if not _exists_table(conn, sch, tab):
-            missing_tables.append(f"{sch}.{tab}")
-    detected_prices = _detect_prices_table(conn)
+def _group_schema(present: frozenset, checked_at: str) -> Dict[str, Any]:
+    # Bez własnego zapytania — zbiór istniejących tabel przychodzi od wywołującego
+    missing_tables: List[str] = [f"{sch}.{tab}" for sch, tab in INPUT_TABLES if f"{sch}.{tab}" not in present]
+    detected_prices = _pick_prices_table(present)
     if not detected_prices:
         missing_tables.append("(prices) input.ceny_godzinowe")
     status = "up" if not missing_tables else "degraded"
@@ -184,73 +274,118 @@ def _group_schema(conn: psycopg.Connection) -> Dict[str, Any]:
         "status": status,
         "missing": {"tables": missing_tables},
         "detected_prices_table": detected_prices,
-        "checked_at": _utcnow_iso(),
+        "checked_at": checked_at,
     }
 
-def _table_stats(conn: psycopg.Connection, schema: str, table: str) -> Dict[str, Any]:
-    try:
-        rows = _query_dicts(
-            conn,
-            f"""
-            SELECT
-              MIN(ts_utc) AS min_ts_utc,
-              MAX(ts_utc) AS max_ts_utc,
-              COUNT(*)   AS cnt
-            FROM {schema}.{table}
-            """,
-        )
-        r = rows[0] if rows else {}
-        min_ts = r.get("min_ts_utc")
-        max_ts = r.get("max_ts_utc")
-        cnt = int(r.get("cnt") or 0)
-        age = (_utcnow() - (max_ts or _utcnow())).total_seconds() if max_ts else None
-        return {
-            "count": cnt,
-            "min_ts_utc": _fmt_ts(min_ts) if min_ts else None,
-            "max_ts_utc": _fmt_ts(max_ts) if max_ts else None,
-            "age_seconds": age,
-            "age_human": _humanize_seconds(age),
-        }
-    except Exception as e:
-        return {"error": str(e), "count": 0, "min_ts_utc": None, "max_ts_utc": None, "age_seconds": None, "age_human": "—"}
+def _fmt_stats(r: Dict[str, Any]) -> Dict[str, Any]:
+    min_ts = r.get("min_ts_utc")
+    max_ts = r.get("max_ts_utc")
+    cnt = int(r.get("cnt") or 0)
+    age = (_utcnow() - max_ts).total_seconds() if max_ts else None
+    return {
+        "count": cnt,
+        "min_ts_utc": _fmt_ts(min_ts) if min_ts else None,
+        "max_ts_utc": _fmt_ts(max_ts) if max_ts else None,
+        "age_seconds": age,
+        "age_human": _humanize_seconds(age),
+    }
+
+def _stats_error(msg: str) -> Dict[str, Any]:
+    return {"error": msg, "count": 0, "min_ts_utc": None, "max_ts_utc": None, "age_seconds": None, "age_human": "—"}
+
+# Szablon statystyk dla jednej tabeli; liczność: estymata reltuples (dokładny COUNT tylko
+# gdy tabela nieanalizowana/pusta albo HEALTH_EXACT_COUNT=1)
+if EXACT_COUNT:
+    _STATS_TMPL = sql.SQL(
+        "SELECT {lbl} AS tbl, MIN(ts_utc) AS min_ts_utc, MAX(ts_utc) AS max_ts_utc, COUNT(*) AS cnt FROM {t}"
+    )
+else:
+    _STATS_TMPL = sql.SQL(
+        "SELECT {lbl} AS tbl,"
+        " (SELECT ts_utc FROM {t} WHERE ts_utc IS NOT NULL ORDER BY ts_utc ASC LIMIT 1) AS min_ts_utc,"
+        " (SELECT ts_utc FROM {t} WHERE ts_utc IS NOT NULL ORDER BY ts_utc DESC LIMIT 1) AS max_ts_utc,"
+        " CASE WHEN c.reltuples > 0 THEN c.reltuples::bigint ELSE (SELECT COUNT(*) FROM {t}) END AS cnt"
+        " FROM pg_class c WHERE c.oid = {lbl}::regclass"
+    )
 
-def _group_data(conn: psycopg.Connection) -> Dict[str, Any]:
+# Wyrenderowane do gotowego tekstu raz przy imporcie (identyfikatory znane z góry) —
+# w żądaniu nie ma już składania sql.Composed ani escapowania identyfikatorów
+_STATS_PARTS: Dict[str, str] = {
+    f"{sch}.{tab}": _STATS_TMPL.format(lbl=sql.Literal(f"{sch}.{tab}"), t=sql.Identifier(sch, tab)).as_string()
+    for sch, tab in INPUT_TABLES + PRICES_CANDIDATES
+}
+
+@functools.lru_cache(maxsize=None)
+def _stats_sql(tables: Tuple[str, ...]) -> str:
+    """MIN/MAX/liczność dla wielu tabel naraz — jeden UNION ALL (stały tekst → prepare=True)."""
+    return "\nUNION ALL\n".join(_STATS_PARTS[fq] for fq in tables)
+
+# Typowy zestaw (wszystkie wejścia + wykryta tabela cen) gotowy od startu
+for _sch, _tab in PRICES_CANDIDATES:
+    _stats_sql(tuple(f"{s}.{t}" for s, t in INPUT_TABLES) + (f"{_sch}.{_tab}",))
+del _sch, _tab
+
+SQL_FORM_LATEST = """
+SELECT inserted_at,
+       left(payload::text, 350)   AS payload_preview,
+       octet_length(payload::text) AS payload_bytes
+FROM params.form_zmienne
+ORDER BY inserted_at DESC
+LIMIT 1
+"""
+
+async def _group_data(conn: psycopg.AsyncConnection, checked_at: str, present: frozenset) -> Dict[str, Any]:
     stats: Dict[str, Any] = {}
-    for sch, tab in INPUT_TABLES:
-        stats[f"{sch}.{tab}"] = _table_stats(conn, sch, tab)
-    prices_tbl = _detect_prices_table(conn)
-    if prices_tbl:
-        sch, tab = prices_tbl.split(".", 1)
-        stats[prices_tbl] = _table_stats(conn, sch, tab)
-    else:
+    prices_tbl = _pick_prices_table(present)
+    wanted = [f"{sch}.{tab}" for sch, tab in INPUT_TABLES]
+    found = [fq for fq in wanted if fq in present] + ([prices_tbl] if prices_tbl else [])
+    has_form = FORM_TABLE in present
+
+    # Statystyki i formularz w osobnych zakresach błędów — awaria jednego zapytania
+    # nie może oznaczyć drugiego (ani wszystkich tabel) jako błędnego
+    stats_rows: List[dict] = []
+    form_rows: List[dict] = []
+    stats_err: Optional[str] = None
+    form_err: Optional[str] = None
+    if found:
+        try:
+            stats_rows = await _query_dicts(conn, _stats_sql(tuple(found)), prepare=True)
+        except Exception as e:
+            stats_err = str(e)
+    if has_form:
+        try:
+            form_rows = await _query_dicts(conn, SQL_FORM_LATEST, prepare=True)
+        except Exception as e:
+            form_err = str(e)
+
+    by_tbl = {r["tbl"]: r for r in stats_rows}
+    for fq in found:
+        stats[fq] = _stats_error(stats_err) if stats_err else _fmt_stats(by_tbl.get(fq, {}))
+    for fq in wanted:
+        if fq not in stats:
+            stats[fq] = _stats_error(f'relation "{fq}" does not exist')
+    if not prices_tbl:
         stats["prices"] = {"error": "prices table not found"}
     degraded = any(("error" in v) or (v.get("count", 0) == 0) for v in stats.values())
     status = "degraded" if degraded else "up"
 
     # Formularz (skrót) – jeśli istnieje
-    form_latest = {"present": False, "inserted_at": None, "payload": None}
-    try:
-        rows = _query_dicts(
-            conn,
-            """
-            SELECT inserted_at, payload
-            FROM params.form_zmienne
-            ORDER BY inserted_at DESC
-            LIMIT 1
-            """,
-        )
-        if rows:
-            form_latest["present"] = True
-            form_latest["inserted_at"] = _fmt_ts(rows[0]["inserted_at"])
-            form_latest["payload"] = rows[0]["payload"]
-    except Exception:
-        pass
-
-    return {"status": status, "stats": stats, "form_zmienne_latest": form_latest, "checked_at": _utcnow_iso()}
+    # Tylko podgląd + rozmiar — pełny JSONB nie jest potrzebny w health
+    form_latest = {"present": False, "inserted_at": None, "payload_preview": None, "payload_bytes": None}
+    if form_rows:
+        form_latest["present"] = True
+        form_latest["inserted_at"] = _fmt_ts(form_rows[0]["inserted_at"])
+        form_latest["payload_preview"] = form_rows[0]["payload_preview"]
+        form_latest["payload_bytes"] = form_rows[0]["payload_bytes"]
+    if form_err:
+        form_latest["error"] = form_err
+
+    return {"status": status, "stats": stats, "form_zmienne_latest": form_latest, "checked_at": checked_at}
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Pasek nawigacji (menu)
 
+@functools.cache
 def _nav(active: str) -> str:
     tabs = [("Overview", "/"), ("Prep", "/prep"), ("Pipeline", "/pipeline")]
     out = []
@@ -262,17 +397,16 @@ def _nav(active: str) -> str:
 # ─────────────────────────────────────────────────────────────────────────────
 # Pipeline (scope='calc') — odczyt z output.health_service
 
-def _group_pipeline(conn: psycopg.Connection) -> Dict[str, Any]:
-    rows = _query_dicts(
-        conn,
-        """
-        SELECT calc_id, params_ts, overall_status, sections, summary, created_at
-        FROM output.health_service
-        WHERE scope='calc'
-        ORDER BY created_at DESC
-        LIMIT 1
-        """,
-    )
+SQL_PIPELINE_LATEST = """
+SELECT calc_id, params_ts, overall_status, sections, summary, created_at
+FROM output.health_service
+WHERE scope='calc'
+ORDER BY created_at DESC
+LIMIT 1
+"""
+
+async def _group_pipeline(conn: psycopg.AsyncConnection) -> Dict[str, Any]:
+    rows = await _query_dicts(conn, SQL_PIPELINE_LATEST, prepare=True)
     if not rows:
         return {"status": "degraded", "present": False, "info": "Brak snapshotu CALC w output.health_service", "snapshot": {}}
     row = rows[0]
@@ -289,9 +423,14 @@ def _group_pipeline(conn: psycopg.Connection) -> Dict[str, Any]:
 # ─────────────────────────────────────────────────────────────────────────────
 # Prep (scope='prep') — snapshot lub fallback live
 
-def _prep_live(conn: psycopg.Connection) -> Dict[str, Any]:
-    schema = _group_schema(conn)
-    data = _group_data(conn)
+async def _schema_and_data(conn: psycopg.AsyncConnection, checked_at: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Jedno wykrycie tabel (cache) współdzielone przez grupy schema i data."""
+    present = await _present_tables(conn, WATCHED_TABLES)
+    return _group_schema(present, checked_at), await _group_data(conn, checked_at, present)
+
+async def _prep_live(conn: psycopg.AsyncConnection) -> Dict[str, Any]:
+    checked_at = _utcnow_iso()
+    schema, data = await _schema_and_data(conn, checked_at)
     input_status = data.get("status", "degraded")
     forms_status = "up" if data.get("form_zmienne_latest", {}).get("present") else "degraded"
     overall = _overall(schema.get("status", "degraded"), input_status, forms_status)
@@ -299,21 +438,20 @@ def _prep_live(conn: psycopg.Connection) -> Dict[str, Any]:
         "status": overall,
         "input": {"status": input_status, "stats": data.get("stats", {})},
         "params": {"status": forms_status, "form_zmienne_latest": data.get("form_zmienne_latest", {})},
-        "created_at": _utcnow_iso(),
+        "created_at": checked_at,
         "summary": "Live PREP (fallback) — brak snapshotu w health_service.",
     }
 
-def _group_prep(conn: psycopg.Connection) -> Dict[str, Any]:
-    rows = _query_dicts(
-        conn,
-        """
-        SELECT overall_status, sections, summary, created_at
-        FROM output.health_service
-        WHERE scope='prep'
-        ORDER BY created_at DESC
-        LIMIT 1
-        """,
-    )
+SQL_PREP_LATEST = """
+SELECT overall_status, sections, summary, created_at
+FROM output.health_service
+WHERE scope='prep'
+ORDER BY created_at DESC
+LIMIT 1
+"""
+
+async def _group_prep(conn: psycopg.AsyncConnection) -> Dict[str, Any]:
+    rows = await _query_dicts(conn, SQL_PREP_LATEST, prepare=True)
     if rows:
         r = rows[0]
         sec = r.get("sections") or {}
@@ -324,56 +462,74 @@ def _group_prep(conn: psycopg.Connection) -> Dict[str, Any]:
             "created_at": _fmt_ts(r.get("created_at")),
             "summary": r.get("summary") or "",
         }
-    return _prep_live(conn)
+    return await _prep_live(conn)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # FastAPI
 
-app = FastAPI(title=f"{APP_NAME} — Health", version=APP_VERSION)
+app = FastAPI(title=f"{APP_NAME} — Health", version=APP_VERSION, default_response_class=ORJSONResponse)
+
+async def _with_conn(fn, *args) -> Any:
+    async with _connect() as conn:
+        return await fn(conn, *args)
+
+async def _load_pipeline() -> Dict[str, Any]:
+    return await _with_conn(_group_pipeline)
 
-@app.get("/status.json", response_class=JSONResponse)
-def health_json():
-    groups, overall = _compute_overview()
-    return {"status": overall, "checked_at": _utcnow_iso(), "groups": groups}
+async def _load_prep() -> Dict[str, Any]:
+    return await _with_conn(_group_prep)
+
+@app.get("/status.json", response_class=ORJSONResponse)
+async def health_json():
+    groups, overall = await _cached("overview", _compute_overview)
+    return {"status": overall, "checked_at": groups["runtime"]["checked_at"], "groups": groups}
+
+@app.get("/ready", response_class=ORJSONResponse)
+async def ready():
+    """Tani probe gotowości: tylko SELECT 1 z puli, bez statystyk i schematu."""
+    try:
+        async def _ping() -> None:
+            async with _connect() as conn:
+                await conn.execute("SELECT 1")
+        await asyncio.wait_for(_ping(), READY_TIMEOUT_S)
+        return {"status": "up"}
+    except Exception as e:
+        return ORJSONResponse({"status": "down", "error": str(e) or type(e).__name__}, status_code=503)
 
 @app.get("/", response_class=HTMLResponse)
-def health_html():
-    groups, overall = _compute_overview()
-    return _page_overview(groups, overall)
+async def health_html():
+    groups, overall = await _cached("overview", _compute_overview)
+    return StreamingResponse(_page_overview_chunks(groups, overall), media_type="text/html; charset=utf-8")
 
-@app.get("/pipeline.json", response_class=JSONResponse)
-def pipeline_json():
+@app.get("/pipeline.json", response_class=ORJSONResponse)
+async def pipeline_json():
     try:
-        with _connect() as conn:
-            pipe = _group_pipeline(conn)
+        pipe = await _cached("pipeline", _load_pipeline)
         return {"status": pipe["status"], "checked_at": _utcnow_iso(), "pipeline": pipe}
     except Exception as e:
-        return JSONResponse({"status": "down", "error": str(e)}, status_code=500)
+        return ORJSONResponse({"status": "down", "error": str(e)}, status_code=500)
 
 @app.get("/pipeline", response_class=HTMLResponse)
-def pipeline_html():
+async def pipeline_html():
     try:
-        with _connect() as conn:
-            pipe = _group_pipeline(conn)
+        pipe = await _cached("pipeline", _load_pipeline)
         return _pipeline_page(pipe)
     except Exception as e:
         err_html = f"<html><body>{_nav('Pipeline')}<h1>Pipeline</h1><p style='color:#e74c3c'>{html.escape(str(e))}</p></body></html>"
         return HTMLResponse(err_html, status_code=500)
 
-@app.get("/prep.json", response_class=JSONResponse)
-def prep_json():
+@app.get("/prep.json", response_class=ORJSONResponse)
+async def prep_json():
     try:
-        with _connect() as conn:
-            prep = _group_prep(conn)
+        prep = await _cached("prep", _load_prep)
         return {"status": prep["status"], "checked_at": _utcnow_iso(), "prep": prep}
     except Exception as e:
-        return JSONResponse({"status": "down", "error": str(e)}, status_code=500)
+        return ORJSONResponse({"status": "down", "error": str(e)}, status_code=500)
 
 @app.get("/prep", response_class=HTMLResponse)
-def prep_html():
+async def prep_html():
     try:
-        with _connect() as conn:
-            prep = _group_prep(conn)
+        prep = await _cached("prep", _load_prep)
         return _prep_page(prep)
     except Exception as e:
         err_html = f"<html><body>{_nav('Prep')}<h1>Prep</h1><p style='color:#e74c3c'>{html.escape(str(e))}</p></body></html>"
@@ -382,26 +538,37 @@ def prep_html():
 # ─────────────────────────────────────────────────────────────────────────────
 # Overview — compute + HTML
 
-def _compute_overview() -> Tuple[Dict[str, Any], str]:
-    runtime = _group_runtime()
-    db = _group_db()
-    try:
-        with _connect() as conn:
-            schema = _group_schema(conn)
-            data = _group_data(conn)
-    except Exception as e:
-        schema = {"status": "down", "error": str(e), "missing": {"tables": []}}
-        data = {"status": "down", "error": str(e), "stats": {}}
+async def _compute_overview() -> Tuple[Dict[str, Any], str]:
+    checked_at = _utcnow_iso()  # jeden znacznik dla wszystkich grup tego sprawdzenia
+    runtime = _group_runtime(checked_at)
+    # db (osobne połączenie) równolegle z schema+data (wspólne wykrycie tabel)
+    db, schema_data = await asyncio.gather(
+        _group_db(checked_at),
+        _with_conn(_schema_and_data, checked_at),
+        return_exceptions=True,
+    )
+    if isinstance(schema_data, Exception):
+        schema = {"status": "down", "error": str(schema_data), "missing": {"tables": []}}
+        data = {"status": "down", "error": str(schema_data), "stats": {}}
+    else:
+        schema, data = schema_data
     forms_status = "up" if data.get("form_zmienne_latest", {}).get("present") else "degraded"
     forms = {"status": forms_status, "info": data.get("form_zmienne_latest", {})}
     groups = {"runtime": runtime, "database": db, "schema": schema, "data": data, "forms": forms}
     overall = _overall(db["status"], schema["status"], data["status"], forms["status"])
     return groups, overall
 
+_CHIP_COLORS = {"up": "#2ecc71", "degraded": "#f39c12", "down": "#e74c3c"}
+
+def _chip_html(status: str, color: str) -> str:
+    return f'<span class="chip" style="background:{color}">{html.escape(status.upper())}</span>'
+
+# Statusy z _overall() to zamknięty zbiór → gotowy HTML
+_CHIP_HTML = {st: _chip_html(st, color) for st, color in _CHIP_COLORS.items()}
+
 def _chip(status: str) -> str:
-    color = {"up": "#2ecc71", "degraded": "#f39c12", "down": "#e74c3c"}.get(status, "#7f8c8d")
-    text = status.upper()
-    return f'<span class="chip" style="background:{color}">{html.escape(text)}</span>'
+    chip = _CHIP_HTML.get(status)
+    return chip if chip is not None else _chip_html(str(status), "#7f8c8d")
 
 def _kpi(title: str, value: str, sub: str = "") -> str:
     sub_html = f'<div class="kpi-sub">{html.escape(sub)}</div>' if sub else ""
@@ -423,7 +590,79 @@ def _fmt_count(v: Any) -> str:
     except Exception:
         return str(v)
 
-def _page_overview(groups: Dict[str, Any], overall: str) -> str:
+# Statyczna część strony Overview (head + CSS) — składana raz przy imporcie
+_APP_NAME_HTML = html.escape(APP_NAME)
+_OVERVIEW_HEAD = """
+<!doctype html>
+<html lang="pl">
+<head>
+<meta charset="utf-8"/>
+<title>Status — """ + _APP_NAME_HTML + """</title>
+<meta name="viewport" content="width=device-width, initial-scale=1"/>
+<style>
+  :root {
+    --bg: #0f172a;
+    --panel: #111827;
+    --text: #e5e7eb;
+    --muted: #9ca3af;
+    --accent: #60a5fa;
+    --ok: #2ecc71;
+    --warn: #f39c12;
+    --err: #e74c3c;
+    --chip: #1f2937;
+    --kpi: #0b1220;
+    --border: #1f2937;
+  }
+  * { box-sizing: border-box; }
+  body {
+    margin: 0;
+    font-family: ui-sans-serif, system-ui, -apple-system, Segoe UI, Roboto, "Helvetica Neue", Arial;
+    color: var(--text);
+    background: radial-gradient(1200px 600px at 20% -20%, #0b1220, #0f172a);
+  }
+  .wrap { max-width: 1200px; margin: 24px auto; padding: 0 16px; }
+  h1 { font-size: 22px; margin: 0 0 8px 0; }
+  .subtitle { color: var(--muted); font-size: 12px; margin-bottom: 16px; }
+  .grid { display: grid; gap: 14px; grid-template-columns: repeat(2, minmax(0, 1fr)); }
+  .panel {
+    background: linear-gradient(180deg, #0d1220, #0b0f1a);
+    border: 1px solid var(--border);
+    border-radius: 12px;
+    padding: 14px;
+  }
+  .panel h2 { font-size: 14px; margin: 0 0 10px 0; display:flex; align-items:center; gap:8px; }
+  .panel h2 .chip { margin-left: 6px; }
+  table { width: 100%; border-collapse: collapse; }
+  td { padding: 6px 8px; border-top: 1px solid #1e293b; font-size: 13px; vertical-align: top; }
+  td:first-child { color: var(--muted); width: 32%; }
+  .chip {
+    display:inline-block; padding:2px 8px; border-radius:999px; font-size:11px;
+    color:#0b0f1a; font-weight:700;
+  }
+  .kpis { display:grid; gap:12px; grid-template-columns: repeat(5, minmax(0, 1fr)); margin: 12px 0 6px; }
+  .kpi {
+    background: var(--kpi);
+    border: 1px solid var(--border);
+    border-radius: 12px;
+    padding: 12px;
+    min-height: 96px;
+  }
+  .kpi-title { font-size:12px; color:var(--muted); margin-bottom:6px; }
+  .kpi-value { font-size:20px; font-weight:800; letter-spacing:0.2px; }
+  .kpi-sub { margin-top:4px; font-size:12px; color:var(--muted); }
+  @media (max-width: 1100px) { .kpis { grid-template-columns: repeat(2, 1fr); } }
+  @media (max-width: 700px) {
+    .grid { grid-template-columns: 1fr; }
+    .kpis { grid-template-columns: 1fr; }
+  }
+  a { color:#93c5fd; text-decoration:none; }
+</style>
+</head>
+<body>
+"""
+
+def _page_overview_chunks(groups: Dict[str, Any], overall: str) -> Iterator[str]:
+    """Strona Overview w kawałkach (head → KPI → panele → dane) pod StreamingResponse."""
     now_txt = _fmt_ts(datetime.fromisoformat(groups["runtime"]["checked_at"]))
     stats = groups["data"].get("stats", {})
     dd = stats.get("input.date_dim", {})
@@ -480,80 +719,16 @@ def _page_overview(groups: Dict[str, Any], overall: str) -> str:
     prod_table = _stats_table("input.produkcja", prod or {})
     ceny_table = _stats_table(prices_key or "prices", ceny or {})
 
-    return f"""
-<!doctype html>
-<html lang="pl">
-<head>
-<meta charset="utf-8"/>
-<title>Status — {html.escape(APP_NAME)}</title>
-<meta name="viewport" content="width=device-width, initial-scale=1"/>
-<style>
-  :root {{
-    --bg: #0f172a;
-    --panel: #111827;
-    --text: #e5e7eb;
-    --muted: #9ca3af;
-    --accent: #60a5fa;
-    --ok: #2ecc71;
-    --warn: #f39c12;
-    --err: #e74c3c;
-    --chip: #1f2937;
-    --kpi: #0b1220;
-    --border: #1f2937;
-  }}
-  * {{ box-sizing: border-box; }}
-  body {{
-    margin: 0;
-    font-family: ui-sans-serif, system-ui, -apple-system, Segoe UI, Roboto, "Helvetica Neue", Arial;
-    color: var(--text);
-    background: radial-gradient(1200px 600px at 20% -20%, #0b1220, #0f172a);
-  }}
-  .wrap {{ max-width: 1200px; margin: 24px auto; padding: 0 16px; }}
-  h1 {{ font-size: 22px; margin: 0 0 8px 0; }}
-  .subtitle {{ color: var(--muted); font-size: 12px; margin-bottom: 16px; }}
-  .grid {{ display: grid; gap: 14px; grid-template-columns: repeat(2, minmax(0, 1fr)); }}
-  .panel {{
-    background: linear-gradient(180deg, #0d1220, #0b0f1a);
-    border: 1px solid var(--border);
-    border-radius: 12px;
-    padding: 14px;
-  }}
-  .panel h2 {{ font-size: 14px; margin: 0 0 10px 0; display:flex; align-items:center; gap:8px; }}
-  .panel h2 .chip {{ margin-left: 6px; }}
-  table {{ width: 100%; border-collapse: collapse; }}
-  td {{ padding: 6px 8px; border-top: 1px solid #1e293b; font-size: 13px; vertical-align: top; }}
-  td:first-child {{ color: var(--muted); width: 32%; }}
-  .chip {{
-    display:inline-block; padding:2px 8px; border-radius:999px; font-size:11px;
-    color:#0b0f1a; font-weight:700;
-  }}
-  .kpis {{ display:grid; gap:12px; grid-template-columns: repeat(5, minmax(0, 1fr)); margin: 12px 0 6px; }}
-  .kpi {{
-    background: var(--kpi);
-    border: 1px solid var(--border);
-    border-radius: 12px;
-    padding: 12px;
-    min-height: 96px;
-  }}
-  .kpi-title {{ font-size:12px; color:var(--muted); margin-bottom:6px; }}
-  .kpi-value {{ font-size:20px; font-weight:800; letter-spacing:0.2px; }}
-  .kpi-sub {{ margin-top:4px; font-size:12px; color:var(--muted); }}
-  @media (max-width: 1100px) {{ .kpis {{ grid-template-columns: repeat(2, 1fr); }} }}
-  @media (max-width: 700px) {{
-    .grid {{ grid-template-columns: 1fr; }}
-    .kpis {{ grid-template-columns: 1fr; }}
-  }}
-  a {{ color:#93c5fd; text-decoration:none; }}
-</style>
-</head>
-<body>
+    yield _OVERVIEW_HEAD
+    yield f"""
   <div class="wrap">
     {_nav("Overview")}
-    <h1>Status systemu — {html.escape(APP_NAME)}</h1>
+    <h1>Status systemu — {_APP_NAME_HTML}</h1>
     <div class="subtitle">Sprawdzone: {now_txt}</div>
 
     <div class="kpis">{kpi_html}</div>
-
+"""
+    yield f"""
     <div class="grid">
       <div class="panel">
         <h2>Runtime {_chip(runtime.get('status','up'))}</h2>
@@ -575,10 +750,11 @@ def _page_overview(groups: Dict[str, Any], overall: str) -> str:
         <table>
           <tr><td>present</td><td>{"TAK" if forms_info.get("present") else "NIE"}</td></tr>
           <tr><td>inserted_at</td><td>{html.escape(forms_info.get("inserted_at") or "—")}</td></tr>
-          <tr><td>payload (preview)</td><td>{html.escape((_safe_json(forms_info.get("payload") or {})[:350]))}</td></tr>
+          <tr><td>payload (preview)</td><td>{html.escape(forms_info.get("payload_preview") or "{}")}</td></tr>
         </table>
       </div>
-
+"""
+    yield f"""
       <div class="panel" style="grid-column: 1 / -1;">
         <h2>Data {_chip(groups['data'].get('status','down'))}</h2>
         <table>
@@ -1,15 +1,19 @@
+import functools
 import logging
 import os
 import sys
 
+@functools.cache
 def get_logger(name: str = "energia-prep-2") -> logging.Logger:
     """
     Konfiguracja loggera:
     - format:  YYYY-mm-dd HH:MM:SS | LEVEL | energia-prep-2 | message
     - poziom z env LOG_LEVEL (domyślnie INFO)
+    Idempotentna: kolejne wywołania (też po reloadzie modułu) nie dokładają handlerów.
     """
     logger = logging.getLogger(name)
-    if logger.handlers:
+    # Nasz handler jest oznaczony — reload modułu czyści cache, ale nie logger z rejestru
+    if any(getattr(h, "_energia_prep2", False) for h in logger.handlers):
         return logger
 
     level_name = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -20,6 +24,7 @@ def get_logger(name: str = "energia-prep-2") -> logging.Logger:
         fmt="%(asctime)s | %(levelname)s | energia-prep-2 | %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
     ))
+    handler._energia_prep2 = True
 
     logger.setLevel(level)
     logger.addHandler(handler)
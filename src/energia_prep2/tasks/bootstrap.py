@@ -1,11 +1,13 @@
 # src/energia_prep2/tasks/bootstrap.py
 from __future__ import annotations
 
+import functools
 import json
 import logging
 import os
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Iterable, List
@@ -43,6 +45,11 @@ SQL_DIR = Path(os.getenv("SQL_DIR", "/app/sql")).resolve()
 FORM_CONFIG = os.getenv("FORM_CONFIG", "/app/config_form.yaml")
 BAD_SUFFIXES = (".swp", ".swo", ".bak", ".tmp", "~")
 
+# Wzorce kompilowane raz (kanonizacja wartości seedu i kontekst błędów SQL)
+_RE_FLOAT = re.compile(r"^-?\d+\.\d+$")
+_RE_INT = re.compile(r"^-?\d+$")
+_RE_ERR_LINE = re.compile(r"LINE\s+(\d+):")
+
 # Pliki wymagające superuser (event trigger, globalne GRANTy, itp.)
 SUPERUSER_FILES = {
     "40_triggers/02_event_triggers.sql",
@@ -74,22 +81,38 @@ def _dsn(user: str | None = None) -> str:
     u = user or DB_USER
     return f"host={DB_HOST} port={DB_PORT} dbname={DB_NAME} user={u} password={DB_PASSWORD} sslmode={DB_SSLMODE}"
 
-def _connect(user: str | None = None):
-    conn = psycopg.connect(_dsn(user), autocommit=True, connect_timeout=8)
+def _set_timezone(conn: psycopg.Connection) -> None:
     with conn.cursor() as cur:
         cur.execute(sql.SQL("SET TIME ZONE {}").format(sql.Literal(DB_TIMEZONE)))
+
+def _connect(user: str | None = None):
+    conn = psycopg.connect(_dsn(user), autocommit=True, connect_timeout=8)
+    _set_timezone(conn)
     return conn
 
+def _reset_session(conn: psycopg.Connection) -> None:
+    """
+    Czyści stan sesji po pliku na współdzielonym połączeniu (SET search_path,
+    client_min_messages, tabele tymczasowe…) — kolejny plik startuje jak na świeżym połączeniu.
+    """
+    if conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+        conn.execute("ROLLBACK")  # niezamknięta transakcja w pliku — jak przy zamknięciu połączenia
+    conn.execute("DISCARD ALL")
+    _set_timezone(conn)
+
+@functools.lru_cache(maxsize=None)
 def _rel(path: Path) -> str:
+    # resolve() dotyka FS — liczymy raz na ścieżkę
     try:
         return str(path.resolve().relative_to(SQL_DIR)).replace("\\", "/")
     except Exception:
         return str(path).replace("\\", "/")
 
-def _iter_exact_paths(order_list: list[str]) -> Iterable[Path]:
+def _iter_exact_paths(order_list: list[str], root: Path | None = None) -> Iterable[Path]:
+    root = SQL_DIR if root is None else root
     for rel in order_list:
-        p = (SQL_DIR / rel).resolve()
-        if p.exists() and p.is_file() and not any(str(p).endswith(s) for s in BAD_SUFFIXES):
+        p = (root / rel).resolve()
+        if p.exists() and p.is_file() and not str(p).endswith(BAD_SUFFIXES):
             yield p
         else:
             if not p.exists():
@@ -110,7 +133,7 @@ def _list_sql_in_dir(rel_dir: str) -> list[str]:
         return []
     files = []
     for p in sorted(d.iterdir()):
-        if p.is_file() and p.suffix.lower() == ".sql" and not any(str(p).endswith(s) for s in BAD_SUFFIXES):
+        if p.is_file() and p.suffix.lower() == ".sql" and not str(p).endswith(BAD_SUFFIXES):
             files.append(str(p.resolve().relative_to(SQL_DIR)).replace("\\", "/"))
     if not files:
         LOG.info("Katalog SQL pusty: %s", d)
@@ -128,11 +151,17 @@ def _log_env(stage: str):
 
 # ── seed GUC (dla params.*) ───────────────────────────────────────────────────
 
+@functools.lru_cache(maxsize=1)
+def _load_config_yaml() -> dict:
+    # Parsujemy raz na proces (błąd nie trafia do cache — kolejne wywołanie spróbuje ponownie)
+    import yaml
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)  # libyaml (C), jeśli dostępny
+    with open(FORM_CONFIG, "r", encoding="utf-8") as f:
+        return yaml.load(f, Loader=loader) or {}
+
 def _read_config_json() -> dict:
     try:
-        import yaml
-        with open(FORM_CONFIG, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f) or {}
+        return _load_config_yaml()
     except Exception as e:
         LOG.warning("FORM_CONFIG nieczytelny (%s): %s", FORM_CONFIG, e)
         return {}
@@ -143,9 +172,9 @@ def _canon_val(v: str):
     try:
         if isinstance(val, str) and val.lower() in ("true", "false"):
             return val.lower() == "true"
-        if re.match(r"^-?\d+\.\d+$", val):
+        if _RE_FLOAT.match(val):
             return float(val)
-        if re.match(r"^-?\d+$", val):
+        if _RE_INT.match(val):
             return int(val)
         return val
     except Exception:
@@ -167,6 +196,7 @@ def _set_params_seed_gucs(cur):
         "form_lcoe",
         "form_par_arbitrazu",
     ]
+    pairs: list[tuple[str, str]] = []
     for sec in sections:
         raw = cfg.get(sec) or {}
         # NIE przerabiamy list/dict przez _canon_val — zostają natywne typy
@@ -175,11 +205,16 @@ def _set_params_seed_gucs(cur):
             for k, v in raw.items() if isinstance(k, str)
         }
         seed_text = json.dumps(data, ensure_ascii=False)
-        guc = f"energia.{sec}_json"
-        # set_config(guc, <czysty JSON>, false)
-        cur.execute("SELECT set_config(%s, %s, false)", (guc, seed_text))
+        pairs.append((f"energia.{sec}_json", seed_text))
         LOG.info("params seed: %s → %d keys", sec, len(data))
 
+    # set_config(guc, <czysty JSON>, false) — wszystkie sekcje jednym zapytaniem (1 round-trip)
+    values = sql.SQL(", ").join(sql.SQL("(%s::text, %s::text)") for _ in pairs)
+    cur.execute(
+        sql.SQL("SELECT set_config(k, v, false) FROM (VALUES {}) AS t(k, v)").format(values),
+        [x for pair in pairs for x in pair],
+    )
+
 # ── SQL executor ──────────────────────────────────────────────────────────────
 
 @dataclass
@@ -190,12 +225,9 @@ class RunResult:
     seconds: float
     ok: bool
 
-def _should_use_superuser(path: Path) -> bool:
-    return _rel(path) in SUPERUSER_FILES
-
 def _extract_error_context(sql_text: str, err: Exception) -> str:
     msg = str(err)
-    m = re.search(r"LINE\s+(\d+):", msg)
+    m = _RE_ERR_LINE.search(msg)
     if not m:
         return "(brak kontekstu linii w błędzie)"
     ln = int(m.group(1))
@@ -205,26 +237,39 @@ def _extract_error_context(sql_text: str, err: Exception) -> str:
     snippet = "\n".join(f"{i+1:5d}: {lines[i]}" for i in range(start, end))
     return f"\nSQL kontekst (linie {start+1}..{end}):\n{snippet}\n       ↑ błąd w okolicy tej linii"
 
-def _run_sql_file(path: Path) -> RunResult:
+def _exec_sql_file(conn: psycopg.Connection, path: Path, sql_text: str):
+    with conn.cursor() as cur:
+        if path.name == "03_params_tables.sql":
+            _set_params_seed_gucs(cur)
+        cur.execute(sql_text)
+
+def _run_sql_file(
+    path: Path,
+    sql_text: str | None = None,
+    conns: dict[str, psycopg.Connection] | None = None,
+) -> RunResult:
+    """
+    Wykonuje jeden plik. `conns` (user → połączenie) pozwala użyć jednego połączenia
+    na użytkownika dla całej serii plików; bez niego — połączenie jednorazowe.
+    """
     rel = _rel(path)
-    sql_text = path.read_text(encoding="utf-8")
-    superuser = _should_use_superuser(path)
+    if sql_text is None:
+        sql_text = path.read_text(encoding="utf-8")
+    superuser = rel in SUPERUSER_FILES
     user = DB_SUPERUSER if superuser else DB_USER
 
     LOG.info("RUN  → %s | user=%s | bytes=%d", rel, user, len(sql_text))
     t0 = time.perf_counter()
-    ok = False
     try:
-        if path.name == "03_params_tables.sql":
-            with _connect(user) as conn, conn.cursor() as cur:
-                _set_params_seed_gucs(cur)
-                cur.execute(sql_text)
+        if conns is None:
+            with _connect(user) as conn:
+                _exec_sql_file(conn, path, sql_text)
         else:
-            with _connect(user) as conn, conn.cursor() as cur:
-                cur.execute(sql_text)
-
-        ok = True
-        return RunResult(path, rel, superuser, time.perf_counter() - t0, ok=True)
+            conn = conns.get(user)
+            if conn is None:
+                conn = conns[user] = _connect(user)
+            _exec_sql_file(conn, path, sql_text)
+            _reset_session(conn)
     except Exception as e:
         dt = time.perf_counter() - t0
         LOG.error("FAIL → %s | %.3fs | %s: %s", rel, dt, e.__class__.__name__, e)
@@ -234,9 +279,10 @@ def _run_sql_file(path: Path) -> RunResult:
         if isinstance(e, RaiseException):
             LOG.error("Sugestia: RAISE w SQL (kontrola zależności).")
         raise
-    finally:
-        if ok:
-            LOG.info("OK   → %s | %.3fs%s", rel, time.perf_counter() - t0, " | superuser" if superuser else "")
+
+    dt = time.perf_counter() - t0  # jeden pomiar: ten sam czas w logu i w RunResult
+    LOG.info("OK   → %s | %.3fs%s", rel, dt, " | superuser" if superuser else "")
+    return RunResult(path, rel, superuser, dt, ok=True)
 
 # ── asercje ───────────────────────────────────────────────────────────────────
 
@@ -256,11 +302,27 @@ def _assert_relation_exists(schema: str, name: str, user: str | None = None):
 
 # ── PUBLIC API ────────────────────────────────────────────────────────────────
 
+def _run_files(paths: List[Path]):
+    """
+    Wykonuje pliki ściśle po kolei; treści czytane z wyprzedzeniem w tle,
+    więc odczyt z dysku chowa się za wykonaniem poprzedniego pliku na serwerze.
+    """
+    if not paths:
+        return
+    conns: dict[str, psycopg.Connection] = {}  # jedno połączenie na użytkownika (autocommit)
+    try:
+        with ThreadPoolExecutor(max_workers=min(4, len(paths)), thread_name_prefix="sql-read") as ex:
+            bodies = [ex.submit(p.read_text, encoding="utf-8") for p in paths]
+            for p, fut in zip(paths, bodies):
+                _run_sql_file(p, fut.result(), conns)
+    finally:
+        for conn in conns.values():
+            conn.close()
+
 def run():
     _banner("BOOTSTRAP START")
     _log_env("BOOTSTRAP")
-    for f in _iter_exact_paths(ORDER_BOOTSTRAP):
-        _run_sql_file(f)
+    _run_files(list(_iter_exact_paths(ORDER_BOOTSTRAP)))
 
     _banner("BOOTSTRAP DONE")
 
@@ -271,6 +333,5 @@ def run_end():
         return
     _banner("BOOTSTRAP END (POST-ETL)")
     _log_env("BOOTSTRAP_END")
-    for f in _iter_exact_paths(ORDER_BOOTSTRAP_END):
-        _run_sql_file(f)
+    _run_files(list(_iter_exact_paths(ORDER_BOOTSTRAP_END)))
     _banner("BOOTSTRAP END DONE")
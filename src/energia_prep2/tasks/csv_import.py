@@ -2,6 +2,8 @@
 from __future__ import annotations
 
 from pathlib import Path
+from typing import Iterable, Iterator
+import numpy as np
 import pandas as pd
 
 from ..cfg import settings
@@ -17,10 +19,14 @@ KONS_PATH = DATA_DIR / settings.CSV_KONSUMPCJA
 PROD_PATH = DATA_DIR / settings.CSV_PRODUKCJA
 CSV_SEP = settings.CSV_SEP
 CSV_DEC = settings.CSV_DEC
-CSV_DAYFIRST = str(settings.CSV_DAYFIRST).lower() == "true"
-TS_PARSE_FMT = "%d.%m.%Y %H:%M"  # dopasowane do plików
+CSV_CHUNK_ROWS = 50_000          # wiersze na porcję przy strumieniowym wczytywaniu
+TS_PARSE_FMT = "%d.%m.%Y %H:%M"  # dopasowane do plików (dayfirst wynika z formatu)
 
-def _read_csv_fixed_headers(path: Path, expected_cols: list[str]) -> pd.DataFrame:
+def _parse_ts(col: pd.Series) -> pd.Series:
+    # cache=True: każdy unikalny napis parsowany raz; jawny format → datetime64[ns], bez object
+    return pd.to_datetime(col, format=TS_PARSE_FMT, cache=True, errors="raise")
+
+def _read_csv_fixed_headers(path: Path, expected_cols: list[str]) -> Iterator[pd.DataFrame]:
     # twarda walidacja liczby kolumn w CSV
     first = pd.read_csv(
         path, sep=CSV_SEP, decimal=CSV_DEC, header=0, encoding="utf-8-sig", nrows=1
@@ -30,7 +36,7 @@ def _read_csv_fixed_headers(path: Path, expected_cols: list[str]) -> pd.DataFram
             f"{path.name}: nieprawidłowa liczba kolumn {first.shape[1]} "
             f"(oczekiwano {len(expected_cols)}: {expected_cols})"
         )
-    # dokładnie te nazwy – zero dorabiania/przycinania
+    # dokładnie te nazwy – zero dorabiania/przycinania; porcjami → pamięć O(porcja), nie O(plik)
     return pd.read_csv(
         path,
         sep=CSV_SEP,
@@ -38,85 +44,110 @@ def _read_csv_fixed_headers(path: Path, expected_cols: list[str]) -> pd.DataFram
         header=0,
         names=expected_cols,
         encoding="utf-8-sig",
+        chunksize=CSV_CHUNK_ROWS,
+        # Timestamp i tak idzie przez _parse_ts — bez zgadywania typu; liczby zostają float64
+        # (kolumny DB to numeric(14,6): float32 ma ~7 cyfr znaczących i gubiłby precyzję)
+        dtype={expected_cols[0]: str},
     )
 
-def _load_konsumpcja(path: Path) -> pd.DataFrame:
-    df = _read_csv_fixed_headers(path, KONS_COLUMNS)
-    df["ts_local"] = pd.to_datetime(
-        df["Timestamp"], dayfirst=CSV_DAYFIRST, format=TS_PARSE_FMT, errors="raise"
-    )
-    df.rename(columns={"Zużycie": "zuzycie_mw"}, inplace=True)
-    df["zuzycie_mw"] = pd.to_numeric(df["zuzycie_mw"], errors="coerce")
-    df = df.dropna(subset=["ts_local"]).copy()
-    return df[["ts_local", "zuzycie_mw"]]
-
-def _load_produkcja(path: Path) -> pd.DataFrame:
-    df = _read_csv_fixed_headers(path, PROD_COLUMNS)
-    df["ts_local"] = pd.to_datetime(
-        df["Timestamp"], dayfirst=CSV_DAYFIRST, format=TS_PARSE_FMT, errors="raise"
-    )
-    df.rename(
-        columns={
-            "PV 1MW PP": "pv_pp_1mwp",
-            "PV 1MW WZ": "pv_wz_1mwp",
-            "Wind 1MWp": "wind_1mwp",
-        },
-        inplace=True,
-    )
-    for c in ["pv_pp_1mwp", "pv_wz_1mwp", "wind_1mwp"]:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
-    df = df.dropna(subset=["ts_local"]).copy()
-    return df[["ts_local", "pv_pp_1mwp", "pv_wz_1mwp", "wind_1mwp"]]
-
-def _insert_konsumpcja(df: pd.DataFrame) -> int:
-    rows = []
-    for _, r in df.iterrows():
-        rows.append((r["ts_local"].to_pydatetime(),
-                     None if pd.isna(r["zuzycie_mw"]) else float(r["zuzycie_mw"])))
-    with get_conn_app() as conn, conn.cursor() as cur:
-        cur.executemany(
-            """
-            INSERT INTO input.konsumpcja (ts_local, zuzycie_mw)
-            VALUES (%s::timestamp, %s::numeric)
-            ON CONFLICT (ts_local) DO UPDATE SET
-              zuzycie_mw = EXCLUDED.zuzycie_mw
-            """,
-            rows,
+def _load_konsumpcja(path: Path) -> Iterator[pd.DataFrame]:
+    for df in _read_csv_fixed_headers(path, KONS_COLUMNS):
+        df["ts_local"] = _parse_ts(df["Timestamp"])
+        df.rename(columns={"Zużycie": "zuzycie_mw"}, inplace=True)
+        df["zuzycie_mw"] = pd.to_numeric(df["zuzycie_mw"], errors="coerce")
+        df = df.dropna(subset=["ts_local"])
+        yield df[["ts_local", "zuzycie_mw"]]
+
+def _load_produkcja(path: Path) -> Iterator[pd.DataFrame]:
+    for df in _read_csv_fixed_headers(path, PROD_COLUMNS):
+        df["ts_local"] = _parse_ts(df["Timestamp"])
+        df.rename(
+            columns={
+                "PV 1MW PP": "pv_pp_1mwp",
+                "PV 1MW WZ": "pv_wz_1mwp",
+                "Wind 1MWp": "wind_1mwp",
+            },
+            inplace=True,
         )
-        conn.commit()
-        return cur.rowcount
+        for c in ["pv_pp_1mwp", "pv_wz_1mwp", "wind_1mwp"]:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+        df = df.dropna(subset=["ts_local"])
+        yield df[["ts_local", "pv_pp_1mwp", "pv_wz_1mwp", "wind_1mwp"]]
 
-def _insert_produkcja(df: pd.DataFrame) -> int:
-    rows = []
-    for _, r in df.iterrows():
-        rows.append((
-            r["ts_local"].to_pydatetime(),
-            None if pd.isna(r["pv_pp_1mwp"]) else float(r["pv_pp_1mwp"]),
-            None if pd.isna(r["pv_wz_1mwp"]) else float(r["pv_wz_1mwp"]),
-            None if pd.isna(r["wind_1mwp"])  else float(r["wind_1mwp"]),
-        ))
-    with get_conn_app() as conn, conn.cursor() as cur:
-        cur.executemany(
+# ─────────────────────────────────────────────────────────────────────────────
+# Zapis: binarny COPY → tymczasowy staging → jeden INSERT … ON CONFLICT
+
+def _copy_upsert(table: str, value_cols: list[str], rows) -> int:
+    """
+    COPY wierszy (ts_local, *value_cols) do tabeli tymczasowej i jeden upsert do `table`.
+    Staging żyje tylko w tej transakcji (ON COMMIT DROP) — połączenia z puli zostają czyste.
+    Duplikaty ts_local (np. cofnięcie zegara DST) → wygrywa ostatni wiersz, jak przy executemany.
+    """
+    cols = ", ".join(value_cols)
+    stg_cols = ", ".join(f"{c} double precision" for c in value_cols)
+    casts = ", ".join(f"{c}::numeric" for c in value_cols)
+    # updated_at podbijany jawnie (brak triggera) — z niego korzysta cache kalkulacji
+    updates = ",\n              ".join([f"{c} = EXCLUDED.{c}" for c in value_cols] + ["updated_at = now()"])
+    with get_conn_app() as conn, conn.transaction(), conn.cursor() as cur:
+        cur.execute(
+            f"""
+            CREATE TEMP TABLE _csv_stg (
+              n        bigint GENERATED ALWAYS AS IDENTITY,
+              ts_local timestamp NOT NULL,
+              {stg_cols}
+            ) ON COMMIT DROP
             """
-            INSERT INTO input.produkcja (ts_local, pv_pp_1mwp, pv_wz_1mwp, wind_1mwp)
-            VALUES (%s::timestamp, %s::numeric, %s::numeric, %s::numeric)
+        )
+        with cur.copy(f"COPY _csv_stg (ts_local, {cols}) FROM STDIN WITH (FORMAT BINARY)") as cp:
+            cp.set_types(["timestamp"] + ["float8"] * len(value_cols))
+            for row in rows:
+                cp.write_row(row)
+        cur.execute(
+            f"""
+            INSERT INTO {table} (ts_local, {cols})
+            SELECT DISTINCT ON (ts_local) ts_local, {casts}
+            FROM _csv_stg
+            ORDER BY ts_local, n DESC
             ON CONFLICT (ts_local) DO UPDATE SET
-              pv_pp_1mwp = EXCLUDED.pv_pp_1mwp,
-              pv_wz_1mwp = EXCLUDED.pv_wz_1mwp,
-              wind_1mwp  = EXCLUDED.wind_1mwp
-            """,
-            rows,
+              {updates}
+            """
         )
-        conn.commit()
         return cur.rowcount
 
+def _nullable_floats(df: pd.DataFrame, col: str) -> list:
+    """Kolumna jako lista float/None (NaN → NULL); bez NaN — samo tolist() (C, natywne float)."""
+    v = df[col].to_numpy(dtype=np.float64)
+    out = v.tolist()
+    mask = np.isnan(v)
+    if mask.any():
+        for i in np.flatnonzero(mask).tolist():
+            out[i] = None
+    return out
+
+def _chunk_rows(chunks: Iterable[pd.DataFrame], value_cols: list[str], loaded: list[int]) -> Iterator[tuple]:
+    """Porcje DataFrame → krotki (ts_local, *value_cols) prosto do COPY; `loaded[0]` zlicza wiersze."""
+    for df in chunks:
+        loaded[0] += len(df)
+        ts = df["ts_local"].dt.to_pydatetime()
+        yield from zip(ts, *(_nullable_floats(df, c) for c in value_cols))
+
+def _insert_konsumpcja(chunks: Iterable[pd.DataFrame]) -> tuple[int, int]:
+    loaded = [0]
+    cols = ["zuzycie_mw"]
+    upserted = _copy_upsert("input.konsumpcja", cols, _chunk_rows(chunks, cols, loaded))
+    return loaded[0], upserted
+
+def _insert_produkcja(chunks: Iterable[pd.DataFrame]) -> tuple[int, int]:
+    loaded = [0]
+    cols = ["pv_pp_1mwp", "pv_wz_1mwp", "wind_1mwp"]
+    upserted = _copy_upsert("input.produkcja", cols, _chunk_rows(chunks, cols, loaded))
+    return loaded[0], upserted
+
 def import_files() -> None:
     log.info("csv: wczytuję pliki: %s | %s", KONS_PATH, PROD_PATH)
-    df_k = _load_konsumpcja(KONS_PATH)
-    df_p = _load_produkcja(PROD_PATH)
-    ins_k = _insert_konsumpcja(df_k)
-    ins_p = _insert_produkcja(df_p)
-    log.info("csv: załadowano wierszy (konsumpcja=%s, produkcja=%s)", len(df_k), len(df_p))
+    n_k, ins_k = _insert_konsumpcja(_load_konsumpcja(KONS_PATH))
+    n_p, ins_p = _insert_produkcja(_load_produkcja(PROD_PATH))
+    log.info("csv: załadowano wierszy (konsumpcja=%s, produkcja=%s)", n_k, n_p)
     log.info("csv: upsert (konsumpcja=%s, produkcja=%s)", ins_k, ins_p)
 
 def run() -> None:
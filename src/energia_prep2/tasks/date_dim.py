@@ -1,8 +1,12 @@
 # src/energia_prep2/tasks/date_dim.py
 from __future__ import annotations
 
+import os
 from datetime import datetime, timedelta, timezone, date
-from typing import List, Tuple, Dict, Optional
+from typing import List, Tuple, Dict
+
+import numpy as np
+import pandas as pd
 
 from ..cfg import settings
 from ..db import get_conn_app
@@ -22,47 +26,15 @@ except Exception:
     PL_HOLIDAYS = None  # jeśli brak pakietu "holidays", święta będą wyłączone
 
 # ───────────────────────── meta PL (bez ts_local w tabeli)
-def _dow_pg(ts: datetime) -> int:
-    """Postgres EXTRACT(DOW): 0=Sun..6=Sat; Python weekday(): 0=Mon..6=Sun"""
-    # mapowanie: Mon(0)->1, Tue->2, ..., Sat->6, Sun(6)->0
-    return (ts.weekday() + 1) % 7
-
-def _as_pl_time(ts_utc: datetime) -> datetime:
-    if PL_TZ is not None:
-        return ts_utc.astimezone(PL_TZ)
-    return ts_utc  # fallback: bez konwersji (UTC)
-
-def _is_holiday_pl(d: date) -> tuple[bool, Optional[str]]:
+def _holiday_map(d0: date, d1: date) -> Dict[date, str]:
+    """
+    Święta PL dla lat zakresu, policzone raz: {data: nazwa}.
+    +1 rok: ostatnie godziny UTC 31.12 to już 1.01 w czasie PL.
+    """
     if PL_HOLIDAYS is None:
-        return False, None
-    name = PL_HOLIDAYS.get(d)
-    return (name is not None), (str(name) if name else None)
-
-def _meta_from_ts(ts_utc: datetime) -> Dict[str, object]:
-    ts_pl = _as_pl_time(ts_utc)
-    is_hol, hol_name = _is_holiday_pl(ts_pl.date())
-    is_workday = (ts_pl.weekday() < 5) and (not is_hol)
-    return {
-        "ts_local": ts_pl.replace(tzinfo=None),
-        "year": ts_pl.year,
-        "month": ts_pl.month,
-        "day": ts_pl.day,
-        "dow": _dow_pg(ts_pl),
-        "hour": ts_pl.hour,
-        "is_workday": is_workday,
-        "is_holiday": is_hol,
-        "holiday_name": hol_name,
-        "granularity": "H",
-        "dt_h": 1.0,
-    }
-
-def _hour_range_closed(start_utc: datetime, end_utc: datetime):
-    """Generator godzin (UTC) domknięty: [start, end], krok 1h."""
-    cur = start_utc
-    step = timedelta(hours=1)
-    while cur <= end_utc:
-        yield cur
-        cur = cur + step
+        return {}
+    years = list(range(d0.year, d1.year + 2))
+    return {d: str(n) for d, n in holidays.country_holidays("PL", years=years).items()}
 
 # ───────────────────────── DDL ensure
 def _ensure_table():
@@ -87,30 +59,95 @@ def _ensure_table():
     CREATE INDEX IF NOT EXISTS ix_date_dim_ts       ON input.date_dim (ts_utc);
     CREATE INDEX IF NOT EXISTS ix_date_dim_ts_local ON input.date_dim (ts_local);
     """
-    with get_conn_app() as con, con.cursor() as cur:
+    with get_conn_app() as con, con.cursor() as cur:  # autocommit (pula)
         cur.execute(sql)
-        con.commit()
 
 # ───────────────────────── budowa/UPSERT
+# Inkrementalnie: dobudowujemy tylko brakujące godziny (0 → zawsze pełny upsert, np. po zmianie meta)
+DATE_DIM_INCREMENTAL = os.getenv("DATE_DIM_INCREMENTAL", "1").strip().lower() not in ("0", "false", "no")
+_STEP = timedelta(hours=1)
+
+SQL_EXISTING_RANGE = """
+    SELECT min(ts_utc), max(ts_utc), count(*)
+    FROM input.date_dim
+    WHERE ts_utc BETWEEN %s AND %s
+"""
+
+_COLS = "ts_utc, ts_local, year, month, day, dow, hour, is_workday, is_holiday, holiday_name, granularity, dt_h"
+
+# Staging tylko na czas transakcji: binarny COPY → jeden INSERT … ON CONFLICT
+SQL_STG_CREATE = "CREATE TEMP TABLE date_dim_stg (LIKE input.date_dim INCLUDING DEFAULTS) ON COMMIT DROP"
+SQL_STG_COPY = f"COPY date_dim_stg ({_COLS}) FROM STDIN WITH (FORMAT BINARY)"
+STG_TYPES = [
+    "timestamptz", "timestamp", "int4", "int4", "int4", "int4", "int4",
+    "bool", "bool", "text", "text", "float8",
+]
+SQL_UPSERT_FROM_STG = f"""
+    INSERT INTO input.date_dim ({_COLS})
+    SELECT {_COLS} FROM date_dim_stg
+    ON CONFLICT (ts_utc) DO UPDATE SET
+      ts_local = EXCLUDED.ts_local,
+      year = EXCLUDED.year,
+      month = EXCLUDED.month,
+      day = EXCLUDED.day,
+      dow = EXCLUDED.dow,
+      hour = EXCLUDED.hour,
+      is_workday = EXCLUDED.is_workday,
+      is_holiday = EXCLUDED.is_holiday,
+      holiday_name = EXCLUDED.holiday_name,
+      granularity = EXCLUDED.granularity,
+      dt_h = EXCLUDED.dt_h
+"""
+
 def _rows_for_range(start_utc: datetime, end_utc: datetime) -> List[Tuple]:
-    rows: List[Tuple] = []
-    for ts in _hour_range_closed(start_utc, end_utc):
-        m = _meta_from_ts(ts)
-        rows.append((
-            ts,                              # ts_utc (timestamptz)
-            m["ts_local"],                   # DODANE: ts_local (timestamp)
-            int(m["year"]),
-            int(m["month"]),
-            int(m["day"]),
-            int(m["dow"]),
-            int(m["hour"]),
-            bool(m["is_workday"]),
-            bool(m["is_holiday"]),
-            m["holiday_name"],
-            str(m["granularity"]),
-            float(m["dt_h"]),
-        ))
-    return rows
+    """
+    Wiersze date_dim dla [start, end] co 1h (UTC) — meta PL liczona wektorowo (pandas/NumPy),
+    bez pętli po godzinach w Pythonie.
+    """
+    idx = pd.date_range(start_utc, end_utc, freq="h")          # oś UTC (tz-aware)
+    local = idx.tz_convert(PL_TZ) if PL_TZ is not None else idx  # fallback: meta po UTC
+    hol_map = _holiday_map(start_utc.date(), end_utc.date())
+
+    hol_names = [hol_map.get(d) for d in local.date]
+    is_hol = np.fromiter((n is not None for n in hol_names), dtype=bool, count=len(hol_names))
+    weekday = local.weekday.to_numpy()                # 0=Mon..6=Sun
+    dow = (weekday + 1) % 7                           # Postgres EXTRACT(DOW): 0=Sun..6=Sat
+    is_workday = (weekday < 5) & ~is_hol
+
+    n = len(idx)
+    return list(zip(
+        idx.to_pydatetime(),                          # ts_utc (timestamptz)
+        local.tz_localize(None).to_pydatetime(),      # DODANE: ts_local (timestamp)
+        local.year.tolist(),
+        local.month.tolist(),
+        local.day.tolist(),
+        dow.tolist(),
+        local.hour.tolist(),
+        is_workday.tolist(),
+        is_hol.tolist(),
+        hol_names,
+        ["H"] * n,                                    # granularity
+        [1.0] * n,                                    # dt_h
+    ))
+
+def _missing_ranges(start_utc: datetime, end_utc: datetime) -> List[Tuple[datetime, datetime]]:
+    """
+    Co trzeba dobudować w [start, end]: istniejąca oś to ciągły blok [min, max]
+    (PK po ts_utc, krok 1h) → brakuje tylko prefiksu/sufiksu. Dziury w środku → pełna przebudowa.
+    """
+    with get_conn_app() as con, con.cursor() as cur:
+        cur.execute(SQL_EXISTING_RANGE, (start_utc, end_utc))
+        lo, hi, cnt = cur.fetchone()
+    if not cnt:
+        return [(start_utc, end_utc)]
+    if cnt != int((hi - lo) / _STEP) + 1:
+        return [(start_utc, end_utc)]
+    out = []
+    if lo > start_utc:
+        out.append((start_utc, lo - _STEP))
+    if hi < end_utc:
+        out.append((hi + _STEP, end_utc))
+    return out
 
 def build() -> None:
     """
@@ -129,35 +166,24 @@ def build() -> None:
     log.info("date_dim: buduję oś UTC %s → %s (1h, inclusive)", start_utc.isoformat(), end_utc.isoformat())
 
     _ensure_table()
-    rows = _rows_for_range(start_utc, end_utc)
+    ranges = _missing_ranges(start_utc, end_utc) if DATE_DIM_INCREMENTAL else [(start_utc, end_utc)]
+    if not ranges:
+        log.info("date_dim: oś kompletna dla zakresu — pomijam przebudowę")
+        return
+    rows = [r for a, b in ranges for r in _rows_for_range(a, b)]
 
     if not rows:
         log.warning("date_dim: brak wierszy do wstawienia (pusty zakres?)")
         return
 
-    upsert_sql = """
-        INSERT INTO input.date_dim (
-          ts_utc, ts_local, year, month, day, dow, hour, is_workday, is_holiday, holiday_name, granularity, dt_h
-        )
-        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-        ON CONFLICT (ts_utc) DO UPDATE SET
-          ts_local = EXCLUDED.ts_local,
-          year = EXCLUDED.year,
-          month = EXCLUDED.month,
-          day = EXCLUDED.day,
-          dow = EXCLUDED.dow,
-          hour = EXCLUDED.hour,
-          is_workday = EXCLUDED.is_workday,
-          is_holiday = EXCLUDED.is_holiday,
-          holiday_name = EXCLUDED.holiday_name,
-          granularity = EXCLUDED.granularity,
-          dt_h = EXCLUDED.dt_h
-    """
-
-    with get_conn_app() as con, con.cursor() as cur:
-        cur.executemany(upsert_sql, rows)
+    with get_conn_app() as con, con.transaction(), con.cursor() as cur:
+        cur.execute(SQL_STG_CREATE)
+        with cur.copy(SQL_STG_COPY) as cp:
+            cp.set_types(STG_TYPES)
+            for row in rows:
+                cp.write_row(row)
+        cur.execute(SQL_UPSERT_FROM_STG)
         affected = cur.rowcount
-        con.commit()
 
     log.info("date_dim: OK — upsert=%d; zakres=%s → %s; dt_h=1.0",
              affected, rows[0][0].isoformat(), rows[-1][0].isoformat())
@@ -1,8 +1,14 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-import json
+from decimal import Decimal
+import os
+
+import orjson
+from psycopg import sql
+from psycopg.rows import dict_row
 
 from ..db import get_conn_app
 from ..log import log
@@ -29,6 +35,9 @@ PARAM_FORMS: Dict[str, List[str]] = {
 
 EPS = 1e-9
 
+# Pełny ostatni wiersz formularza (z payload) w snapshocie — tylko do debugowania
+PREP_SNAPSHOT_FULL_ROW = os.getenv("PREP_SNAPSHOT_FULL_ROW", "0").strip().lower() not in ("0", "false", "no")
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Modele i utilsy
 
@@ -40,46 +49,105 @@ class Check:
 def _utcnow_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
-def _exists_table(cur, schema: str, table: str) -> bool:
-    cur.execute("""
-        SELECT 1 FROM information_schema.tables
-        WHERE table_schema=%s AND table_name=%s
-        LIMIT 1
-    """, (schema, table))
-    return cur.fetchone() is not None
-
-def _detect_prices_table(cur) -> Optional[str]:
+SQL_EXISTING_TABLES = """
+    SELECT table_schema, table_name FROM information_schema.tables
+    WHERE table_schema = ANY(%s)
+"""
+
+# Schematy, których tabele sprawdza snapshot PREP
+_WATCHED_SCHEMAS = sorted(
+    {s for s, _ in INPUT_TABLES + PRICES_CANDIDATES} | {k.split(".", 1)[0] for k in PARAM_FORMS}
+)
+
+def _load_existing_tables(cur) -> set[tuple[str, str]]:
+    """Jeden odczyt information_schema na cały przebieg zamiast zapytania per tabela."""
+    cur.execute(SQL_EXISTING_TABLES, (_WATCHED_SCHEMAS,))
+    return {(s, t) for s, t in cur.fetchall()}
+
+SQL_PARAM_COLUMNS = """
+    SELECT table_schema || '.' || table_name, column_name FROM information_schema.columns
+    WHERE table_schema || '.' || table_name = ANY(%s)
+"""
+
+def _load_param_columns(cur) -> Dict[str, set]:
+    """Kolumny tabel PARAM_FORMS (generowane z payload) — jeden odczyt na przebieg."""
+    cur.execute(SQL_PARAM_COLUMNS, (list(PARAM_FORMS),))
+    out: Dict[str, set] = {}
+    for tbl, col in cur.fetchall():
+        out.setdefault(tbl, set()).add(col)
+    return out
+
+def _detect_prices_table(existing: set[tuple[str, str]]) -> Optional[str]:
     for s, t in PRICES_CANDIDATES:
-        if _exists_table(cur, s, t):
+        if (s, t) in existing:
             return f"{s}.{t}"
     return None
 
-def _table_stats(cur, schema: str, table: str) -> Dict[str, Any]:
-    cur.execute(f"SELECT MIN(ts_utc), MAX(ts_utc), COUNT(*) FROM {schema}.{table}")
-    min_ts, max_ts, cnt = cur.fetchone()
+# Tabele, w których pilnujemy duplikatów ts_utc (plus wykryta tabela cen)
+DUP_TABLES: List[str] = ["input.konsumpcja", "input.produkcja"]
+
+def _stats_select(full_table: str, *, dups: bool = False, bad_flags: bool = False) -> str:
+    """
+    MIN/MAX/COUNT w jednym przebiegu po tabeli; opcjonalnie w tym samym skanie:
+    - dups:      nadmiarowe wiersze ts_utc (COUNT(*) - COUNT(DISTINCT ts_utc)),
+    - bad_flags: ceny NaN/±Infinity (tylko tabela cen).
+    Stały układ kolumn → da się składać w UNION ALL.
+    """
+    dups_expr = "COUNT(*) - COUNT(DISTINCT ts_utc)" if dups else "NULL::bigint"
+    bad_expr = (
+        "COUNT(*) FILTER (WHERE price_pln_mwh::text IN ('NaN','Infinity','-Infinity'))"
+        if bad_flags else "NULL::bigint"
+    )
+    return (
+        f"SELECT '{full_table}'::text, MIN(ts_utc), MAX(ts_utc), COUNT(*), {dups_expr}, {bad_expr} "
+        f"FROM {full_table}"
+    )
+
+def _stats_dict(min_ts, max_ts, cnt, dups, bad_flags) -> Dict[str, Any]:
     age = None
     if max_ts:
         age = (datetime.now(timezone.utc) - max_ts).total_seconds()
-    return {
+    out = {
         "count": int(cnt or 0),
         "min_ts_utc": min_ts.replace(microsecond=0).isoformat() if min_ts else None,
         "max_ts_utc": max_ts.replace(microsecond=0).isoformat() if max_ts else None,
         "age_seconds": age,
     }
+    if dups is not None:
+        out["dups"] = int(dups)
+    if bad_flags is not None:
+        out["bad_flags"] = int(bad_flags)
+    return out
+
+def _table_stats_many(cur, jobs: Dict[str, Dict[str, bool]]) -> Dict[str, Dict[str, Any]]:
+    """Statystyki kilku tabel jednym zapytaniem (UNION ALL) — jeden round-trip."""
+    if not jobs:
+        return {}
+    cur.execute(" UNION ALL ".join(_stats_select(key, **opts) for key, opts in jobs.items()))
+    got = {row[0]: _stats_dict(*row[1:]) for row in cur.fetchall()}
+    # Kolejność kluczy jak w jobs (stabilny JSON snapshotu)
+    return {key: got[key] for key in jobs}
+
+def _table_stats_own_conn(jobs: Dict[str, Dict[str, bool]]) -> Dict[str, Dict[str, Any]]:
+    with get_conn_app() as conn, conn.cursor() as cur:
+        return _table_stats_many(cur, jobs)
 
-def _dup_count(cur, full_table: str) -> Optional[int]:
-    s, t = full_table.split(".", 1)
-    if not _exists_table(cur, s, t):
-        return None
-    cur.execute(f"""
-        SELECT COUNT(*) FROM (
-          SELECT ts_utc, COUNT(*) c
-          FROM {s}.{t}
-          GROUP BY ts_utc
-          HAVING COUNT(*)>1
-        ) d
-    """)
-    return int(cur.fetchone()[0] or 0)
+def _stats_parallel(groups: List[Dict[str, Dict[str, bool]]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Każda grupa = jedno zapytanie UNION ALL na własnym połączeniu z puli; grupy idą
+    równolegle, więc czas ≈ najwolniejsza grupa, nie suma. Połączenie wywołującego
+    (zapis snapshotu) zostaje wolne.
+    """
+    groups = [g for g in groups if g]
+    if not groups:
+        return {}
+    # wątek (i połączenie z puli db) na grupę
+    with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="prep-stats") as ex:
+        futs = [ex.submit(_table_stats_own_conn, g) for g in groups]
+        out: Dict[str, Dict[str, Any]] = {}
+        for f in futs:
+            out.update(f.result())
+        return out
 
 def _ensure_health_service(cur) -> None:
     cur.execute("""
@@ -98,6 +166,12 @@ def _ensure_health_service(cur) -> None:
       ON output.health_service (scope, created_at DESC);
     """)
 
+def _json_default(o: Any) -> Any:
+    # numeric z kolumn formularzy → liczba JSON; reszta (np. daty w trybie pełnego wiersza) → tekst
+    if isinstance(o, Decimal):
+        return float(o)
+    return str(o)
+
 def _merge_status(*statuses: str) -> str:
     if any(s == "down" for s in statuses):
         return "down"
@@ -108,65 +182,67 @@ def _merge_status(*statuses: str) -> str:
 # ─────────────────────────────────────────────────────────────────────────────
 # Główna logika PREP snapshot
 
-def _build_prep_sections(cur) -> Dict[str, Any]:
-    # Legacy „smoke” (zachowujemy dotychczasowe checki finalize)
-    legacy_checks: List[Check] = []
-
-    # 1) date_dim > 0
-    cur.execute("SELECT COUNT(*) FROM input.date_dim")
-    n_date_dim = int(cur.fetchone()[0] or 0)
-    legacy_checks.append(Check(ok=(n_date_dim > 0), detail=f"input.date_dim count={n_date_dim}"))
-
-    # 2) tge.prices istnieje (legacy; dopuszczamy też input.ceny_godzinowe)
-    cur.execute("""
-        SELECT EXISTS (
-          SELECT 1 FROM information_schema.tables
-          WHERE table_schema='tge' AND table_name='prices'
-        )
-    """)
-    exists_tge = bool(cur.fetchone()[0])
-    legacy_checks.append(Check(ok=exists_tge, detail="tge.prices exists (legacy)"))
-
-    # 3) widok output.vw_energy_calc_input (jeśli wciąż używany)
-    cur.execute("""
-        SELECT EXISTS (
-          SELECT 1 FROM information_schema.views
-          WHERE table_schema='output' AND table_name='vw_energy_calc_input'
-        )
-    """)
-    exists_vw = bool(cur.fetchone()[0])
-    legacy_checks.append(Check(ok=exists_vw, detail="output.vw_energy_calc_input exists (legacy)"))
+SQL_LEGACY_CHECKS = """
+    SELECT
+      (SELECT COUNT(*) FROM input.date_dim) AS n_date_dim,
+      EXISTS (
+        SELECT 1 FROM information_schema.tables
+        WHERE table_schema='tge' AND table_name='prices'
+      ) AS exists_tge,
+      EXISTS (
+        SELECT 1 FROM information_schema.views
+        WHERE table_schema='output' AND table_name='vw_energy_calc_input'
+      ) AS exists_vw
+"""
+
+def _legacy_checks(cur) -> List[Check]:
+    """Legacy „smoke” finalize — jeden round-trip zamiast trzech osobnych zapytań."""
+    cur.execute(SQL_LEGACY_CHECKS)
+    n_date_dim, exists_tge, exists_vw = cur.fetchone()
+    n_date_dim = int(n_date_dim or 0)
+    return [
+        # 1) date_dim > 0
+        Check(ok=(n_date_dim > 0), detail=f"input.date_dim count={n_date_dim}"),
+        # 2) tge.prices istnieje (legacy; dopuszczamy też input.ceny_godzinowe)
+        Check(ok=bool(exists_tge), detail="tge.prices exists (legacy)"),
+        # 3) widok output.vw_energy_calc_input (jeśli wciąż używany)
+        Check(ok=bool(exists_vw), detail="output.vw_energy_calc_input exists (legacy)"),
+    ]
+
+def _build_prep_sections(cur, legacy_checks: Optional[List[Check]] = None) -> Dict[str, Any]:
+    # Legacy „smoke” (zachowujemy dotychczasowe checki finalize); run() podaje gotowe
+    if legacy_checks is None:
+        legacy_checks = _legacy_checks(cur)
+
+    existing = _load_existing_tables(cur)
 
     # Sekcja INPUT
     stats: Dict[str, Any] = {}
     issues: List[str] = []
+    # INPUT: jedno zapytanie UNION ALL; ceny (największa tabela) — osobno, równolegle
+    input_jobs: Dict[str, Dict[str, bool]] = {}
+    prices_jobs: Dict[str, Dict[str, bool]] = {}
     for s, t in INPUT_TABLES:
-        if not _exists_table(cur, s, t):
+        if (s, t) not in existing:
             issues.append(f"missing table {s}.{t}")
             stats[f"{s}.{t}"] = {"error": "table not found", "count": 0}
         else:
-            stats[f"{s}.{t}"] = _table_stats(cur, s, t)
+            input_jobs[f"{s}.{t}"] = {"dups": f"{s}.{t}" in DUP_TABLES}
 
-    prices_tbl = _detect_prices_table(cur)
+    prices_tbl = _detect_prices_table(existing)
     if not prices_tbl:
         issues.append("prices table not found")
         stats["prices"] = {"error": "prices table not found", "count": 0}
-        ceny_bad_flags = None
     else:
-        s, t = prices_tbl.split(".", 1)
-        stats[prices_tbl] = _table_stats(cur, s, t)
-        cur.execute(f"""
-            SELECT COUNT(*) FROM {prices_tbl}
-            WHERE price_pln_mwh::text IN ('NaN','Infinity','-Infinity')
-        """)
-        ceny_bad_flags = int(cur.fetchone()[0] or 0)
-
-    dups = {
-        "input.konsumpcja": _dup_count(cur, "input.konsumpcja"),
-        "input.produkcja": _dup_count(cur, "input.produkcja"),
-    }
+        prices_jobs[prices_tbl] = {"dups": True, "bad_flags": True}
+
+    stats.update(_stats_parallel([input_jobs, prices_jobs]))
+    ceny_bad_flags = stats[prices_tbl].pop("bad_flags") if prices_tbl else None
+
+    # Duplikaty z tego samego skanu co statystyki (None = brak tabeli)
+    dups = {k: stats.get(k, {}).get("dups") for k in DUP_TABLES}
     if prices_tbl:
-        dups[prices_tbl] = _dup_count(cur, prices_tbl)
+        dups[prices_tbl] = stats[prices_tbl]["dups"]
 
     hard_errors = []
     for key, st in stats.items():
@@ -182,21 +258,31 @@ def _build_prep_sections(cur) -> Dict[str, Any]:
     # Sekcja PARAMS – ostatnie rekordy i zakresy
     forms_detail: Dict[str, Any] = {}
     forms_status = "up"
+    param_columns = _load_param_columns(cur)
     for tbl, cols in PARAM_FORMS.items():
         schema, table = tbl.split(".", 1)
-        present = _exists_table(cur, schema, table)
+        present = (schema, table) in existing
         missing_cols: List[str] = []
         range_issues: List[str] = []
         row_out: Dict[str, Any] = {}
         if present:
-            cur.execute(f"SELECT * FROM {tbl} ORDER BY updated_at DESC NULLS LAST, inserted_at DESC NULLS LAST LIMIT 1")
-            row = cur.fetchone()
-            if row is None:
+            if PREP_SNAPSHOT_FULL_ROW:
+                fields = sql.SQL("*")
+            else:
+                # Tylko kolumny formularza, które istnieją (bez payload i reszty wiersza)
+                fields = sql.SQL(", ").join(
+                    sql.Identifier(c) for c in cols if c in param_columns.get(tbl, ())
+                )
+            q = sql.SQL(
+                "SELECT {} FROM {}.{} ORDER BY updated_at DESC NULLS LAST, inserted_at DESC NULLS LAST LIMIT 1"
+            ).format(fields, sql.Identifier(schema), sql.Identifier(table))
+            with cur.connection.cursor(row_factory=dict_row) as dcur:
+                dcur.execute(q)
+                row_out = dcur.fetchone()
+            if row_out is None:
+                row_out = {}
                 present = False
             else:
-                # row jako dict
-                cols_names = [desc.name for desc in cur.description]
-                row_out = dict(zip(cols_names, row))
                 # brakujące kolumny
                 for c in cols:
                     if row_out.get(c) is None:
@@ -262,37 +348,17 @@ def run() -> None:
     Walidacja PREP po imporcie + zapis snapshotu do output.health_service (scope='prep').
     Zachowuje stare logi finalize (OK/ERR) i podnosi wyjątek, gdy którykolwiek check jest nie-OK.
     """
-    checks: list[Check] = []
-
     with get_conn_app() as conn, conn.cursor() as cur:
-        # ZACHOWANIE STARYCH LOGÓW (jak w oryginale)
-        cur.execute("SELECT count(*) FROM input.date_dim")
-        n = int(cur.fetchone()[0] or 0)
-        checks.append(Check(ok=(n > 0), detail=f"input.date_dim count={n}"))
-
-        cur.execute("""
-            SELECT EXISTS (
-              SELECT 1 FROM information_schema.tables WHERE table_schema='tge' AND table_name='prices'
-            )
-        """)
-        exists = bool(cur.fetchone()[0])
-        checks.append(Check(ok=exists, detail="tge.prices exists"))
-
-        cur.execute("""
-            SELECT EXISTS (
-              SELECT 1 FROM information_schema.views WHERE table_schema='output' AND table_name='vw_energy_calc_input'
-            )
-        """)
-        exists_v = bool(cur.fetchone()[0])
-        checks.append(Check(ok=exists_v, detail="output.vw_energy_calc_input exists"))
+        # ZACHOWANIE STARYCH LOGÓW (jak w oryginale) — te same checki trafiają do sekcji „legacy”
+        checks = _legacy_checks(cur)
 
         # NOWE: zbuduj sekcje PREP i zapisz snapshot do output.health_service
         _ensure_health_service(cur)
-        overall, sections, summary = _build_prep_sections(cur)
+        overall, sections, summary = _build_prep_sections(cur, checks)
         cur.execute("""
           INSERT INTO output.health_service (scope, overall_status, sections, summary)
           VALUES ('prep', %s, %s::jsonb, %s)
-        """, (overall, json.dumps(sections, ensure_ascii=False), summary))
+        """, (overall, orjson.dumps(sections, default=_json_default).decode(), summary))
 
     any_fail = False
     for c in checks:
@@ -1,17 +1,21 @@
 # src/energia_prep2/tasks/params_api.py
 from __future__ import annotations
 
-import json
 import logging
 import os
 import re
+import threading
+from contextlib import contextmanager
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, Iterator, Optional, Tuple
 
+import orjson
 import psycopg
 from fastapi import APIRouter, FastAPI, HTTPException, Request
 from psycopg import sql
 from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from psycopg_pool import ConnectionPool
 import yaml
 
 # -----------------------------------------------------------------------------
@@ -44,11 +48,51 @@ def _dsn() -> str:
         f"user={DB_USER} password={DB_PASSWORD} sslmode={DB_SSLMODE}"
     )
 
-def _connect():
-    conn = psycopg.connect(_dsn(), autocommit=True, connect_timeout=8)
+# Pula połączeń (lazy) — żądania nie płacą za handshake ani SET TIME ZONE
+_POOL_MIN_SIZE = 2
+_POOL_MAX_SIZE = 10
+_POOL_TIMEOUT_S = 8.0
+# Start aplikacji nie czeka pełnego timeoutu na niedostępną DB (POST i tak ponowi DDL)
+_STARTUP_TIMEOUT_S = 2.0
+_POOL: Optional[ConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+def _configure(conn: psycopg.Connection) -> None:
+    # raz na nowe połączenie w puli
     with conn.cursor() as cur:
         cur.execute(sql.SQL("SET TIME ZONE {}").format(sql.Literal(DB_TZ)))
-    return conn
+
+def _pool() -> ConnectionPool:
+    global _POOL
+    if _POOL is not None:
+        return _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            pool = ConnectionPool(
+                conninfo=_dsn(),
+                kwargs={"autocommit": True, "connect_timeout": 8},
+                configure=_configure,
+                min_size=_POOL_MIN_SIZE,
+                max_size=_POOL_MAX_SIZE,
+                name="energia-prep-2:params",
+                open=False,
+            )
+            # bez czekania: gdy DB jeszcze nie wstała, błąd wyjdzie przy pobraniu połączenia
+            pool.open(wait=False)
+            _POOL = pool
+    return _POOL
+
+def close_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.close()
+
+@contextmanager
+def _connect(timeout: float = _POOL_TIMEOUT_S) -> Iterator[psycopg.Connection]:
+    with _pool().connection(timeout=timeout) as conn:
+        yield conn
 
 def _execute(conn, query: str, params: Optional[tuple] = None):
     with conn.cursor(row_factory=dict_row) as cur:
@@ -112,11 +156,16 @@ END;
 $$;
 """
 
-def _ensure_util_enqueue_objects():
+# Ustawiane po udanym UTIL_ENQUEUE_DDL — POST nie powtarza DDL przy każdym żądaniu
+_ENQUEUE_DDL_DONE = False
+
+def _ensure_util_enqueue_objects(timeout: float = _POOL_TIMEOUT_S):
+    global _ENQUEUE_DDL_DONE
     try:
-        with _connect() as conn:
+        with _connect(timeout) as conn:
             with conn.cursor() as cur:
                 cur.execute(UTIL_ENQUEUE_DDL)
+        _ENQUEUE_DDL_DONE = True
         log.info("bootstrap: util.enqueue_calc + params.calc_job_queue OK")
     except Exception as e:
         log.warning("bootstrap: util enqueue objects failed: %s", e)
@@ -142,16 +191,42 @@ def _build_from_config(cfg: Dict[str, Any]) -> Tuple[Dict[str, Tuple[str, str]],
         fsec = cfg.get(form_name, {}) or {}
         fields[form_name] = fsec
 
+    # schema/table są stałe po załadowaniu configu — walidujemy raz, nie per request
+    for form_name, (schema, table) in tables.items():
+        if not SAFE_IDENT_RE.match(schema) or not SAFE_IDENT_RE.match(table):
+            raise ValueError(f"Invalid schema/table for form {form_name}: {schema}.{table}")
+
     return tables, fields
 
 _CONFIG: Dict[str, Any] = {}
+_CONFIG_MTIME: Optional[int] = None
 TABLES: Dict[str, Tuple[str, str]] = {}
 FORM_FIELDS: Dict[str, Dict[str, Any]] = {}
+# Formularze, dla których kolumny wg configu są już zapewnione (per proces)
+_COLUMNS_ENSURED: set[str] = set()
+# Gotowe (wyrenderowane) zapytania per formularz — bez składania sql.* per request
+_SQL: Dict[str, Dict[str, str]] = {}
+# Specy pól sparsowane raz przy ładowaniu configu: {form: {col: (typ, skala, kwant|None)}}
+PARSED_FIELDS: Dict[str, Dict[str, Tuple[str, Optional[int], Optional[Decimal]]]] = {}
 
 def _reload_config():
-    global _CONFIG, TABLES, FORM_FIELDS
+    global _CONFIG, _CONFIG_MTIME, TABLES, FORM_FIELDS, PARSED_FIELDS, _SQL
+    mtime = os.stat(FORM_CONFIG).st_mtime_ns
+    if mtime == _CONFIG_MTIME:
+        return  # plik bez zmian — nie parsujemy YAML ponownie
     _CONFIG      = _load_config(FORM_CONFIG)
     TABLES, FORM_FIELDS = _build_from_config(_CONFIG)
+    PARSED_FIELDS = {
+        form: {col: _parsed_field(spec) for col, spec in fsec.items()}
+        for form, fsec in FORM_FIELDS.items()
+    }
+    _SQL = {
+        form: {
+            "save": SQL_SAVE_FORM.format(tbl=sql.Identifier(schema, table)).as_string(),
+        }
+        for form, (schema, table) in TABLES.items()
+    }
+    _CONFIG_MTIME = mtime
     log.info("params_api: forms loaded: %s", list(TABLES.keys()))
 
 # -----------------------------------------------------------------------------
@@ -180,6 +255,16 @@ def _parse_type(spec: Any) -> Tuple[str, Optional[int]]:
     if t in ("array", "json"):  return "array", None
     return "text", None
 
+# Kwanty Decimal dla typowych skal (number;N) — bez alokacji per pole per request
+_QUANT: Dict[int, Decimal] = {d: Decimal(1).scaleb(-d) for d in range(0, 13)}
+
+def _parsed_field(spec: Any) -> Tuple[str, Optional[int], Optional[Decimal]]:
+    t, d = _parse_type(spec)
+    quant = None
+    if t == "number" and d is not None:
+        quant = _QUANT.get(d) or Decimal(1).scaleb(-d)
+    return t, d, quant
+
 def _sql_type(t: str, p: Optional[int]) -> str:
     if t == "integer": return "integer"
     if t == "number":
@@ -197,37 +282,59 @@ def _ensure_table_columns(schema: str, table: str, fields: Dict[str, Any], conn)
     """, (schema, table))
     existing = {r["column_name"] for r in (rows or [])}
 
-    for col, spec in (fields or {}).items():
-        if col in existing:
-            continue
-        t, p = _parse_type(spec)
-        col_type = _sql_type(t, p)
-        s = sql.SQL("ALTER TABLE {}.{} ADD COLUMN IF NOT EXISTS {} {}").format(
-            sql.Identifier(schema),
-            sql.Identifier(table),
-            sql.Identifier(col),
-            sql.SQL(col_type),
-        )
-        _execute_sql(conn, s)
-        log.info("params_api: added column %s.%s.%s %s", schema, table, col, col_type)
+    missing = [
+        (col, _sql_type(*_parse_type(spec)))
+        for col, spec in (fields or {}).items()
+        if col not in existing
+    ]
+    if not missing:
+        return
+    # Jeden ALTER TABLE z wieloma ADD COLUMN — jedna blokada i jedna zmiana katalogu
+    s = sql.SQL("ALTER TABLE {}.{} ").format(sql.Identifier(schema), sql.Identifier(table)) + sql.SQL(", ").join(
+        sql.SQL("ADD COLUMN IF NOT EXISTS {} {}").format(sql.Identifier(col), sql.SQL(col_type))
+        for col, col_type in missing
+    )
+    _execute_sql(conn, s)
+    log.info(
+        "params_api: added columns to %s.%s: %s",
+        schema, table, ", ".join(f"{col} {col_type}" for col, col_type in missing),
+    )
+
+def _ensure_params_index(schema: str, table: str, conn):
+    """
+    Indeks pod „ostatni wiersz” (ORDER BY updated_at DESC NULLS LAST, inserted_at DESC NULLS LAST LIMIT 1)
+    — odczyt najnowszego payloadu idzie po indeksie zamiast pełnego skanu.
+    Bez INCLUDE (payload): duże jsonb przekroczyłyby limit rozmiaru krotki btree.
+    """
+    s = sql.SQL(
+        "CREATE INDEX IF NOT EXISTS {} ON {}.{} (updated_at DESC NULLS LAST, inserted_at DESC NULLS LAST)"
+    ).format(
+        sql.Identifier(f"ix_{table}_updated_at"),
+        sql.Identifier(schema),
+        sql.Identifier(table),
+    )
+    _execute_sql(conn, s)
 
 # -----------------------------------------------------------------------------
 # Payload helpers
 # -----------------------------------------------------------------------------
-def _latest_payload(conn, schema: str, table: str) -> Dict[str, Any]:
-    s = sql.SQL("""
-        SELECT payload
-        FROM {}.{}
-        ORDER BY updated_at DESC
-        LIMIT 1
-    """).format(sql.Identifier(schema), sql.Identifier(table))
-    rows = _execute_sql(conn, s)
-    return (rows[0]["payload"] if rows else {}) or {}
-
-def _merge_payload(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
-    merged = dict(old or {})
-    merged.update(new or {})
-    return merged
+# Zapis formularza jednym zapytaniem: ostatni payload (seed) || nowe pola → INSERT → enqueue.
+# Wynik: brak wiersza = brak seeda (→ 409); job_id NULL = payload bez zmian (nic nie zapisano,
+# nic nie zakolejkowano). Całość atomowa: błąd enqueue cofa też INSERT.
+SQL_SAVE_FORM = sql.SQL("""
+    WITH seed AS (
+      SELECT payload FROM {tbl}
+      ORDER BY updated_at DESC NULLS LAST, inserted_at DESC NULLS LAST
+      LIMIT 1
+    ), merged AS (
+      SELECT seed.payload AS old_payload, COALESCE(seed.payload, '{{}}'::jsonb) || %b AS new_payload FROM seed
+    ), ins AS (
+      INSERT INTO {tbl} (payload)
+      SELECT new_payload FROM merged WHERE new_payload IS DISTINCT FROM old_payload
+      RETURNING 1
+    )
+    SELECT (SELECT util.enqueue_calc(now()) FROM ins) AS job_id FROM merged
+""")
 
 ARRAY_KEYS_BY_FORM = {
     "form_par_arbitrazu": {
@@ -235,24 +342,36 @@ ARRAY_KEYS_BY_FORM = {
     },
 }
 
+_INT_RE = re.compile(r"[+-]?\d+")
+
+def _coerce_int_list(v: Any, keep_other: bool = False) -> list:
+    """
+    Lista (lub JSON-string listy) → elementy całkowite jako int.
+    keep_other=False: pozostałe elementy są odrzucane; True: zostają bez zmian.
+    """
+    if isinstance(v, str):
+        try:
+            v = orjson.loads(v)
+        except Exception:
+            return []
+    if not isinstance(v, (list, tuple)):
+        return []
+    if keep_other:
+        return [int(x) if _INT_RE.fullmatch(str(x)) else x for x in v]
+    return [int(x) for x in v if _INT_RE.fullmatch(str(x))]
+
 def _typed_from_input(input_data: Dict[str, Any], form: str) -> Dict[str, Any]:
-    fsec = FORM_FIELDS.get(form, {}) or {}
+    parsed = PARSED_FIELDS.get(form, {})
     array_keys = ARRAY_KEYS_BY_FORM.get(form, set())
     out: Dict[str, Any] = {}
-    for k, spec in fsec.items():
+    for k, (t, d, quant) in parsed.items():
         if k not in input_data:
             continue
-        t, d = _parse_type(spec)
         v = input_data[k]
 
         if k in array_keys:
             try:
-                if isinstance(v, str):
-                    v = json.loads(v)
-                if isinstance(v, (list, tuple)):
-                    v = [int(x) for x in v if str(x).lstrip("+-").isdigit()]
-                else:
-                    v = []
+                v = _coerce_int_list(v)
             except Exception:
                 v = []
             out[k] = v
@@ -263,28 +382,13 @@ def _typed_from_input(input_data: Dict[str, Any], form: str) -> Dict[str, Any]:
                 v = int(Decimal(str(v)).to_integral_value(rounding=ROUND_HALF_UP))
             elif t == "number":
                 dv = Decimal(str(v))
-                if d is not None:
-                    dv = dv.quantize(Decimal(1).scaleb(-d), rounding=ROUND_HALF_UP)
+                if quant is not None:
+                    dv = dv.quantize(quant, rounding=ROUND_HALF_UP)
                 v = float(dv)
             elif t == "boolean":
                 v = str(v).strip().lower() in ("1","true","yes","y","on")
             elif t == "array":
-                if isinstance(v, str):
-                    try:
-                        v = json.loads(v)
-                    except Exception:
-                        v = []
-                if isinstance(v, (list, tuple)):
-                    vv = []
-                    for x in v:
-                        sx = str(x).lstrip("+-")
-                        if sx.isdigit():
-                            vv.append(int(x))
-                        else:
-                            vv.append(x)
-                    v = vv
-                else:
-                    v = []
+                v = _coerce_int_list(v, keep_other=True)
             else:
                 v = str(v)
         except Exception:
@@ -304,6 +408,25 @@ def health():
     except Exception as e:
         return {"status": "ERROR", "detail": str(e)}
 
+@router.post("/admin/bootstrap")
+def admin_bootstrap():
+    """Ręczne ponowienie UTIL_ENQUEUE_DDL (np. po nieudanym starcie)."""
+    _ensure_util_enqueue_objects()
+    if not _ENQUEUE_DDL_DONE:
+        raise HTTPException(status_code=500, detail="util enqueue bootstrap failed — see logs")
+    return {"ok": True}
+
+@router.post("/admin/reload-columns")
+def reload_columns():
+    """Po zmianie configu: zapomnij zapewnione formularze i dołóż kolumny od nowa."""
+    _COLUMNS_ENSURED.clear()
+    try:
+        ensure_columns_from_config(None)
+    except Exception as e:
+        log.exception("API: reload-columns failed: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"ok": True, "forms": sorted(_COLUMNS_ENSURED)}
+
 @router.post("/form/{form_name}")
 async def post_form(form_name: str, request: Request):
     log.info("API: POST /form/%s — start", form_name)
@@ -313,13 +436,10 @@ async def post_form(form_name: str, request: Request):
         raise HTTPException(status_code=404, detail=f"Unknown form: {form_name}")
     schema, table = TABLES[form_name]
 
-    if not SAFE_IDENT_RE.match(schema) or not SAFE_IDENT_RE.match(table):
-        log.error("API: invalid schema/table: %s.%s", schema, table)
-        raise HTTPException(status_code=400, detail="Invalid schema/table")
-
     try:
         body = await request.json()
-        log.info("API: RAW request body for %s → %s", form_name, body)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("API: RAW request body for %s → %s", form_name, body)
     except Exception:
         log.exception("API: invalid JSON body for %s", form_name)
         raise HTTPException(status_code=400, detail="Invalid JSON body")
@@ -329,71 +449,52 @@ async def post_form(form_name: str, request: Request):
         log.error("API: body not an object for %s: %r", form_name, payload_in)
         raise HTTPException(status_code=400, detail="Body must be an object or {'payload': {...}}")
 
-    log.info("API: input payload for %s → %s", form_name, payload_in)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("API: input payload for %s → %s", form_name, payload_in)
 
     typed = _typed_from_input(payload_in, form_name)
-    log.info("API: typed payload for %s → %s", form_name, typed)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("API: typed payload for %s → %s", form_name, typed)
+    log.info("API: POST /form/%s keys=%d", form_name, len(typed))
+
+    # obiekty util/calc_job_queue — tylko jeśli start się nie udał (np. DB jeszcze nie wstała)
+    if not _ENQUEUE_DDL_DONE:
+        _ensure_util_enqueue_objects()
 
     try:
         with _connect() as conn:
-            # upewnij się, że mamy obiekty util/calc_job_queue (idempotentnie)
-            try:
-                with conn.cursor() as cur:
-                    cur.execute(UTIL_ENQUEUE_DDL)
-            except Exception as e:
-                log.warning("API: util enqueue bootstrap during POST failed: %s", e)
-
             # 1) kolumny wg configu
-            log.debug("API: ensure columns for %s.%s", schema, table)
-            _ensure_table_columns(schema, table, FORM_FIELDS.get(form_name, {}), conn)
-
-            # 2) seed istnieje?
-            exists_sql = sql.SQL("SELECT 1 FROM {}.{} LIMIT 1").format(
-                sql.Identifier(schema), sql.Identifier(table)
-            )
-            with conn.cursor() as cur:
-                cur.execute(exists_sql)
-                has_seed = cur.fetchone() is not None
-            log.info("API: seed exists for %s.%s → %s", schema, table, has_seed)
-            if not has_seed:
+            if form_name not in _COLUMNS_ENSURED:
+                log.debug("API: ensure columns for %s.%s", schema, table)
+                _ensure_table_columns(schema, table, FORM_FIELDS.get(form_name, {}), conn)
+                _COLUMNS_ENSURED.add(form_name)
+
+            # 2) seed + scalenie (jsonb ||) + INSERT + enqueue (gdy coś się zmieniło) — jeden round-trip
+            with conn.cursor(row_factory=dict_row) as cur:
+                # stały kształt zapytania → prepared na połączeniu z puli; jsonb binarnie
+                cur.execute(_SQL[form_name]["save"], [Jsonb(typed, dumps=orjson.dumps)], prepare=True)
+                r = cur.fetchone()
+            if r is None:
+                # brak seeda → nic nie wstawiono, nic nie zakolejkowano
                 log.error("API: missing seed in %s.%s", schema, table)
                 raise HTTPException(
                     status_code=409,
                     detail=f"No seed row in {schema}.{table}. Run bootstrap/config seed first."
                 )
-
-            # 3) scalenie z poprzednim payloadem
-            old = _latest_payload(conn, schema, table)
-            log.info("API: old payload (top row) for %s.%s → %s", schema, table, old)
-            merged_payload = _merge_payload(old, typed)
-            log.info("API: merged payload for %s.%s → %s", schema, table, merged_payload)
-
-            # 4) INSERT tylko payload
-            s = sql.SQL("INSERT INTO {}.{} (payload) VALUES (%s)").format(
-                sql.Identifier(schema),
-                sql.Identifier(table),
-            )
-            log.debug("API: SQL to execute for %s.%s → INSERT payload", schema, table)
-
-            job_id = None
-            with _connect() as conn2:
-                with conn2.cursor(row_factory=dict_row) as cur2:
-                    cur2.execute(s, [json.dumps(merged_payload, ensure_ascii=False)])
-                    log.info("API: DB INSERT done for %s.%s, rowcount=%s", schema, table, getattr(cur2, "rowcount", "?"))
-
-                    # enqueue → util.enqueue_calc
-                    try:
-                        cur2.execute("SELECT util.enqueue_calc(now()) AS job_id")
-                        r = cur2.fetchone()
-                        job_id = r["job_id"] if r and "job_id" in r else None
-                        log.info("API: util.enqueue_calc issued, job_id=%s", job_id)
-                    except Exception as e:
-                        log.warning("API: util.enqueue_calc failed (params saved ok): %s", e)
+            job_id = r["job_id"]
+            if job_id is None:
+                # identyczny payload jak ostatni — bez INSERT i bez przeliczenia
+                log.debug("API: payload unchanged for %s.%s — skipped INSERT/enqueue", schema, table)
+            else:
+                log.info("API: DB INSERT + util.enqueue_calc done for %s.%s, job_id=%s", schema, table, job_id)
 
         resp = {"ok": True, "form": form_name, "inserted_keys": list(typed.keys())}
         if job_id:
             resp["job_id"] = str(job_id)
-        log.info("API: response to client for %s → %s", form_name, resp)
+        else:
+            resp["unchanged"] = True
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("API: response to client for %s → %s", form_name, resp)
         return resp
 
     except HTTPException:
@@ -405,42 +506,48 @@ async def post_form(form_name: str, request: Request):
 # -----------------------------------------------------------------------------
 # Public helper(s) for app_server.py
 # -----------------------------------------------------------------------------
-def ensure_columns_from_config(form_name: Optional[str] = None) -> None:
+def ensure_columns_from_config(form_name: Optional[str] = None, *, timeout: float = _POOL_TIMEOUT_S) -> None:
     _reload_config()
-    with _connect() as conn:
+    with _connect(timeout) as conn:
         if form_name is None:
             for form, (schema, table) in TABLES.items():
                 _ensure_table_columns(schema, table, FORM_FIELDS.get(form, {}), conn)
+                _ensure_params_index(schema, table, conn)
+                _COLUMNS_ENSURED.add(form)
         else:
             if form_name not in TABLES:
                 raise ValueError(f"Unknown form: {form_name}")
             schema, table = TABLES[form_name]
             _ensure_table_columns(schema, table, FORM_FIELDS.get(form_name, {}), conn)
-
-# -----------------------------------------------------------------------------
-# App factory
-# -----------------------------------------------------------------------------
-def create_app() -> FastAPI:
-    # Bootstrap util.enqueue_calc + kolejka na starcie
-    _ensure_util_enqueue_objects()
-
+            _ensure_params_index(schema, table, conn)
+            _COLUMNS_ENSURED.add(form_name)
+
+def startup_bootstrap() -> None:
+    """
+    Obiekty kolejkowania + kolumny formularzy na starcie (idempotentnie).
+    Krótki timeout: gdy DB jeszcze nie wstała, start nie blokuje — POST/admin ponowią.
+    """
+    _ensure_util_enqueue_objects(_STARTUP_TIMEOUT_S)
     try:
-        ensure_columns_from_config(None)
+        ensure_columns_from_config(None, timeout=_STARTUP_TIMEOUT_S)
         log.info("startup: ensure_columns_from_config OK")
     except Exception as e:
         log.warning("startup: ensure_columns_from_config() failed: %s", e)
 
+# -----------------------------------------------------------------------------
+# App factory
+# -----------------------------------------------------------------------------
+def create_app() -> FastAPI:
+    # Bez pracy na DB przy imporcie — robi to startup (samodzielnie) / lifespan app_server
     app = FastAPI(title="energia-prep-2 Params API", version="1.0.0")
 
     @app.on_event("startup")
     def _on_startup():
-        # jeszcze raz, idempotentnie (jeśli kontener się podnosi zanim DB będzie gotowe)
-        _ensure_util_enqueue_objects()
-        try:
-            ensure_columns_from_config(None)
-            log.info("startup(event): ensure_columns_from_config OK")
-        except Exception as e:
-            log.warning("startup(event): ensure_columns_from_config() failed: %s", e)
+        startup_bootstrap()
+
+    @app.on_event("shutdown")
+    def _on_shutdown():
+        close_pool()
 
     app.include_router(router)
     return app
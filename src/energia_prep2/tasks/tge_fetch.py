@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import itertools
+import queue
+import threading
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Any, List, Tuple
+from typing import Any, Iterator, List, Tuple
 from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
 
+import ijson
+import orjson
 import requests
 
 from ..cfg import settings
@@ -20,30 +26,76 @@ HEADERS = {
     "Accept": "application/json",
 }
 
+# Wspólna sesja HTTP: keep-alive + pula połączeń (bez nowego TCP/TLS na każde pobranie)
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
 # Docelowa tabela w schemacie input
 TABLE_FULL = "input.ceny_godzinowe"
 
 
-def _with_params(base: str, **params) -> str:
-    """Dokłada / nadpisuje parametry w URL bez dublowania (np. all=1, days=365)."""
-    parts = urlparse(base)
-    q = dict(parse_qsl(parts.query, keep_blank_values=True))
+# BASE jest stały — parsujemy go raz przy imporcie
+_BASE_PARTS = urlparse(BASE)
+_BASE_Q = dict(parse_qsl(_BASE_PARTS.query, keep_blank_values=True))
+
+
+def _with_params(**params) -> str:
+    """Dokłada / nadpisuje parametry w URL bazowym bez dublowania (np. all=1, days=365)."""
+    q = dict(_BASE_Q)
     q.update({k: str(v) for k, v in params.items() if v is not None})
-    new_qs = urlencode(q)
-    return urlunparse(parts._replace(query=new_qs))
+    return urlunparse(_BASE_PARTS._replace(query=urlencode(q)))
 
 
 def _url_full() -> str:
     """Pełna historia – ZAWSZE z all=1."""
-    return _with_params(BASE, all=1)
+    return _with_params(all=1)
 
 
 def _url_days(days: int) -> str:
     """Aktualizacja – ostatnie N dni (np. 365)."""
-    return _with_params(BASE, days=int(days))
+    return _with_params(days=int(days))
+
+
+def _to_float(x):
+    try:
+        return float(x) if x is not None else None
+    except Exception:
+        return None
 
 
-def _rows_from_payload(payload: Any) -> List[Tuple[datetime, float | None, float | None, float | None, float | None]]:
+@dataclass(slots=True)
+class PriceCols:
+    """
+    Ceny w układzie kolumnowym (SoA): pięć równoległych list zamiast listy krotek.
+    unnest() dostaje kolumny wprost (bez transpozycji), COPY — wiersze przez zip().
+    ts_utc trzyma kanoniczny ISO w UTC (datetime.isoformat(), "…+00:00") — rzutowanie na
+    timestamptz robi Postgres; ten sam tekst = ta sama chwila (deduplikacja, span()).
+    """
+    ts_utc: List[str] = field(default_factory=list)
+    fixing_i_price: List[float | None] = field(default_factory=list)
+    fixing_i_volume: List[float | None] = field(default_factory=list)
+    fixing_ii_price: List[float | None] = field(default_factory=list)
+    fixing_ii_volume: List[float | None] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.ts_utc)
+
+    def columns(self) -> List[list]:
+        return [self.ts_utc, self.fixing_i_price, self.fixing_i_volume, self.fixing_ii_price, self.fixing_ii_volume]
+
+    def rows(self) -> Iterator[Tuple[str, float | None, float | None, float | None, float | None]]:
+        return zip(*self.columns())
+
+    def span(self) -> Tuple[str, str]:
+        """(min, max) ts_utc — jedno przejście zamiast sortowania (ISO w UTC sortuje się leksykalnie)."""
+        return min(self.ts_utc), max(self.ts_utc)
+
+    def take(self, idx: List[int]) -> "PriceCols":
+        return PriceCols(*([col[i] for i in idx] for col in self.columns()))
+
+
+def _rows_from_payload(payload: Any) -> PriceCols:
     """
     Oczekujemy formatu:
       {
@@ -51,109 +103,392 @@ def _rows_from_payload(payload: Any) -> List[Tuple[datetime, float | None, float
         "fixing_i":  {"price": <float>, "volume": <float>},
         "fixing_ii": {"price": <float>, "volume": <float>}
       }
-    Zwracamy listę:
-      (ts_utc, fixing_i_price, fixing_i_volume, fixing_ii_price, fixing_ii_volume)
+    Zwracamy kolumny (PriceCols):
+      ts_utc, fixing_i_price, fixing_i_volume, fixing_ii_price, fixing_ii_volume
+    `payload` może też być strumieniem rekordów (_fetch_records).
     """
     if isinstance(payload, dict):
         payload = payload.get("data", [])
 
-    rows: List[Tuple[datetime, float | None, float | None, float | None, float | None]] = []
-    if not isinstance(payload, list):
-        return rows
+    cols = PriceCols()
+    if not isinstance(payload, (list, Iterator)):
+        return cols
+
+    # Lokalne wiązania — pętla idzie po każdym rekordzie historii
+    # fromisoformat jest w C (_datetime) — ciso8601 niepotrzebne
+    fromiso = datetime.fromisoformat
+    utc = timezone.utc
+    to_float = _to_float
+    ts_append = cols.ts_utc.append
+    fi_p, fi_v = cols.fixing_i_price.append, cols.fixing_i_volume.append
+    fii_p, fii_v = cols.fixing_ii_price.append, cols.fixing_ii_volume.append
 
     for rec in payload:
         if not isinstance(rec, dict) or "date" not in rec:
             continue
 
+        s = rec["date"]
         try:
-            ts_utc = datetime.fromisoformat(str(rec["date"]).replace("Z", "+00:00")).astimezone(timezone.utc)
+            # Parsujemy zawsze (walidacja: zły rekord odpada tu, a nie w rzutowaniu całej paczki),
+            # ale do bazy idzie kanoniczny tekst UTC — ta sama chwila = ten sam klucz deduplikacji.
+            # API zwraca "…Z" → już UTC: samo doklejenie tzinfo, bez przeliczania offsetu
+            if s.endswith("Z"):
+                ts_utc = fromiso(s[:-1]).replace(tzinfo=utc).isoformat()
+            else:
+                ts_utc = fromiso(s).astimezone(utc).isoformat()
         except Exception:
             continue
 
         fi = rec.get("fixing_i") or {}
         fii = rec.get("fixing_ii") or {}
+        ts_append(ts_utc)
+        fi_p(to_float(fi.get("price")))
+        fi_v(to_float(fi.get("volume")))
+        fii_p(to_float(fii.get("price")))
+        fii_v(to_float(fii.get("volume")))
+
+    # Bez sortowania: UPSERT jest niezależny od kolejności, a zakres do logów daje span()
+    return cols
+
+
+SQL_UPSERT_PAGE = f"""
+    INSERT INTO {TABLE_FULL}
+        (ts_utc, fixing_i_price, fixing_i_volume, fixing_ii_price, fixing_ii_volume)
+    SELECT * FROM unnest(%s::timestamptz[], %s::float8[], %s::float8[], %s::float8[], %s::float8[])
+    ON CONFLICT (ts_utc) DO UPDATE SET
+        fixing_i_price   = EXCLUDED.fixing_i_price,
+        fixing_i_volume  = EXCLUDED.fixing_i_volume,
+        fixing_ii_price  = EXCLUDED.fixing_ii_price,
+        fixing_ii_volume = EXCLUDED.fixing_ii_volume
+"""
+
+
+def _pages(cols: PriceCols, size: int):
+    """Kolumny → paczki (5 list) pod unnest(); duplikaty ts_utc → wygrywa ostatni (jak przy executemany)."""
+    last = {t: i for i, t in enumerate(cols.ts_utc)}
+    if len(last) != len(cols):
+        cols = cols.take(sorted(last.values()))
+    columns = cols.columns()
+    for i in range(0, len(cols), size):
+        yield [col[i:i + size] for col in columns]
+
+
+def _upsert_rows(cols: PriceCols) -> int:
+    """
+    UPSERT do input.ceny_godzinowe 1:1 z API — jedno INSERT … SELECT unnest(...) na paczkę wierszy.
+    Ścieżka update_import (krótkie okno); pełna historia idzie przez _copy_upsert.
+    """
+    if not cols:
+        return 0
 
-        def _to_float(x):
-            try:
-                return float(x) if x is not None else None
-            except Exception:
-                return None
+    page_size = settings.TGE_UPSERT_PAGE_SIZE
+    log.info("tge: upsert %d wierszy, page_size=%d", len(cols), page_size)
 
-        fi_price = _to_float(fi.get("price"))
-        fi_vol = _to_float(fi.get("volume"))
-        fii_price = _to_float(fii.get("price"))
-        fii_vol = _to_float(fii.get("volume"))
+    inserted = 0
+    with get_conn_app() as conn, conn.cursor() as cur:
+        # Połączenia z puli są w autocommit → jawna transakcja = jedna paczka, jeden COMMIT;
+        # pipeline: kolejne paczki wysyłane bez czekania na odpowiedź poprzedniej
+        # prepare_threshold=0: INSERT przygotowany na serwerze od pierwszej paczki (Parse raz,
+        # dalej tylko Bind/Execute); przywracamy, bo połączenie wraca do puli
+        prev_threshold = conn.prepare_threshold
+        conn.prepare_threshold = 0
+        try:
+            with conn.transaction(), conn.pipeline():
+                cur.executemany(SQL_UPSERT_PAGE, _pages(cols, page_size))
+        finally:
+            conn.prepare_threshold = prev_threshold
+        inserted = cur.rowcount
+    return inserted
 
-        rows.append((ts_utc, fi_price, fi_vol, fii_price, fii_vol))
 
-    rows.sort(key=lambda r: r[0])
-    return rows
+SQL_STG_CREATE = """
+    CREATE TEMP TABLE _tge_stg (
+      n                 bigint GENERATED ALWAYS AS IDENTITY,
+      ts_utc            text NOT NULL,
+      fixing_i_price    double precision,
+      fixing_i_volume   double precision,
+      fixing_ii_price   double precision,
+      fixing_ii_volume  double precision
+    ) ON COMMIT DROP
+"""
+
+SQL_STG_COPY = (
+    "COPY _tge_stg (ts_utc, fixing_i_price, fixing_i_volume, fixing_ii_price, fixing_ii_volume) "
+    "FROM STDIN WITH (FORMAT BINARY)"
+)
+STG_TYPES = ["text", "float8", "float8", "float8", "float8"]
+
+SQL_UPSERT_FROM_STG = f"""
+    INSERT INTO {TABLE_FULL}
+        (ts_utc, fixing_i_price, fixing_i_volume, fixing_ii_price, fixing_ii_volume)
+    SELECT DISTINCT ON (ts_utc) ts_utc, fixing_i_price, fixing_i_volume, fixing_ii_price, fixing_ii_volume
+    FROM (
+        SELECT n, ts_utc::timestamptz AS ts_utc,
+               fixing_i_price, fixing_i_volume, fixing_ii_price, fixing_ii_volume
+        FROM _tge_stg
+    ) s
+    ORDER BY ts_utc, n DESC
+    ON CONFLICT (ts_utc) DO UPDATE SET
+        fixing_i_price   = EXCLUDED.fixing_i_price,
+        fixing_i_volume  = EXCLUDED.fixing_i_volume,
+        fixing_ii_price  = EXCLUDED.fixing_ii_price,
+        fixing_ii_volume = EXCLUDED.fixing_ii_volume
+"""
+
+
+def _copy_upsert(cols: PriceCols) -> int:
+    """
+    Pełna historia: binarny COPY do tabeli tymczasowej i jeden INSERT … ON CONFLICT.
+    Staging żyje tylko w tej transakcji (ON COMMIT DROP); duplikaty ts_utc → wygrywa ostatni.
+    """
+    if not cols:
+        return 0
+    with get_conn_app() as conn, conn.transaction(), conn.cursor() as cur:
+        cur.execute(SQL_STG_CREATE)
+        with cur.copy(SQL_STG_COPY) as cp:
+            cp.set_types(STG_TYPES)
+            for row in cols.rows():
+                cp.write_row(row)
+        cur.execute(SQL_UPSERT_FROM_STG)
+        return cur.rowcount
+
+
+# ── Walidatory HTTP (ETag / Last-Modified / Content-Length) per URL ─────────
+# 304 Not Modified (update) / niezmieniony HEAD (pełny import) → nic nie pobieramy i nie zapisujemy
+NOT_MODIFIED = object()
+
+SQL_META_GET = "SELECT etag, last_modified, content_length FROM input.tge_fetch_meta WHERE url = %s"
+SQL_META_PUT = """
+    INSERT INTO input.tge_fetch_meta (url, etag, last_modified, content_length)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (url) DO UPDATE SET
+        etag           = EXCLUDED.etag,
+        last_modified  = EXCLUDED.last_modified,
+        content_length = EXCLUDED.content_length,
+        updated_at     = now()
+"""
+
+
+def _load_validators(url: str) -> dict[str, Any]:
+    """Ostatnie ETag/Last-Modified/Content-Length dla URL; brak tabeli/wpisu → pusty słownik (zwykły GET)."""
+    try:
+        with get_conn_app() as conn, conn.cursor() as cur:
+            cur.execute(SQL_META_GET, (url,))
+            row = cur.fetchone()
+    except Exception as e:
+        log.warning("tge: nie odczytano input.tge_fetch_meta (%s) — pobieram bez warunków", e)
+        return {}
+    return {"etag": row[0], "last_modified": row[1], "content_length": row[2]} if row else {}
 
 
-def _upsert_rows(rows: List[Tuple[datetime, float | None, float | None, float | None, float | None]]) -> int:
-    """UPSERT do input.ceny_godzinowe 1:1 z API."""
-    if not rows:
-        return 0
+def _store_validators(url: str, validators: dict[str, Any]) -> None:
+    """Zapis po udanym imporcie — dopiero wtedy kolejny 304 jest bezpieczny."""
+    if not validators.get("etag") and not validators.get("last_modified"):
+        return
+    try:
+        with get_conn_app() as conn, conn.cursor() as cur:
+            cur.execute(SQL_META_PUT, (url, validators.get("etag"), validators.get("last_modified"),
+                                       validators.get("content_length")))
+    except Exception as e:
+        log.warning("tge: nie zapisano input.tge_fetch_meta: %s", e)
 
-    inserted = 0
-    with get_conn_app() as conn, conn.cursor() as cur:
-        sql = f"""
-            INSERT INTO {TABLE_FULL}
-                (ts_utc, fixing_i_price, fixing_i_volume, fixing_ii_price, fixing_ii_volume)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (ts_utc) DO UPDATE SET
-                fixing_i_price   = EXCLUDED.fixing_i_price,
-                fixing_i_volume  = EXCLUDED.fixing_i_volume,
-                fixing_ii_price  = EXCLUDED.fixing_ii_price,
-                fixing_ii_volume = EXCLUDED.fixing_ii_volume
-        """
-        cur.executemany(sql, rows)
-        inserted = cur.rowcount
-        conn.commit()
-    return inserted
 
+def _head(url: str) -> dict[str, Any]:
+    """HEAD — same nagłówki (ETag / Last-Modified / Content-Length), bez body."""
+    r = _SESSION.head(url, timeout=30, allow_redirects=True)
+    r.raise_for_status()
+    length = r.headers.get("Content-Length")
+    return {
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "content_length": int(length) if length and length.isdigit() else None,
+    }
+
+
+def _unchanged(old: dict[str, Any], new: dict[str, Any]) -> bool:
+    """ETag rozstrzyga, gdy jest po obu stronach; bez niego Last-Modified + Content-Length muszą się zgadzać."""
+    if not old:
+        return False
+    if old.get("etag") and new.get("etag"):
+        return old["etag"] == new["etag"]
+    pair = ("last_modified", "content_length")
+    return all(new.get(k) is not None for k in pair) and all(old.get(k) == new.get(k) for k in pair)
 
-def _fetch(url: str) -> Any:
+
+def _fetch(url: str, validators: dict[str, str | None] | None = None) -> tuple[Any, dict[str, str | None]]:
+    """
+    GET z opcjonalnym If-None-Match / If-Modified-Since.
+    Zwraca (payload | NOT_MODIFIED, walidatory z odpowiedzi).
+    """
     log.info("tge: fetch %s", url)
-    r = requests.get(url, headers=HEADERS, timeout=60)
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    r = _SESSION.get(url, headers=headers, timeout=60, stream=False)
+    if r.status_code == 304:
+        return NOT_MODIFIED, validators or {}
     r.raise_for_status()
-    return r.json()
+    got = {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+    # orjson parsuje bajty wprost (bez dekodowania do str jak r.json())
+    return orjson.loads(r.content), got
+
+
+_STREAM_CHUNK = 1 << 16
+_PREFETCH_DEPTH = 16  # ile porcji body może czekać na parser (≈1 MB)
+
+
+def _prefetched(chunks: Iterator[bytes], depth: int = _PREFETCH_DEPTH) -> Iterator[bytes]:
+    """
+    Pobieranie w osobnym wątku (I/O zwalnia GIL), parsowanie w bieżącym — sieć i parser
+    pracują naraz zamiast na zmianę. Błąd pobierania jest podnoszony po stronie konsumenta.
+    Konsument kończący wcześniej (błąd parsera, close()) zatrzymuje wątek przez `stop`.
+    """
+    q: queue.Queue = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def _put(item) -> bool:
+        # put z timeoutem: pełna kolejka nie blokuje wątku na zawsze, gdy nikt już nie czyta
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _pump() -> None:
+        try:
+            for chunk in chunks:
+                if not _put(chunk):
+                    return
+        except BaseException as e:  # przekazujemy do konsumenta
+            _put(e)
+        finally:
+            _put(done)
+
+    threading.Thread(target=_pump, name="tge-download", daemon=True).start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def _fetch_records(url: str) -> Iterator[dict]:
+    """
+    Strumieniowy GET + przyrostowy parser JSON (ijson): rekordy wychodzą w trakcie pobierania,
+    bez trzymania w pamięci całego body i drzewa JSON. Obsługuje {"data": [...]} i gołą listę.
+    """
+    log.info("tge: fetch (stream) %s", url)
+    with _SESSION.get(url, timeout=60, stream=True) as r:
+        r.raise_for_status()
+        chunks = _prefetched(r.iter_content(_STREAM_CHUNK))
+        try:
+            first = next(chunks, b"")
+            prefix = "item" if first.lstrip()[:1] == b"[" else "data.item"
+            out = ijson.sendable_list()
+            coro = ijson.items_coro(out, prefix, use_float=True)
+            for chunk in itertools.chain((first,), chunks):
+                coro.send(chunk)
+                yield from out
+                del out[:]
+            coro.close()
+            yield from out
+        finally:
+            chunks.close()  # zatrzymuje wątek pobierania przed zamknięciem odpowiedzi
+
+
+SQL_HAS_ROWS = f"SELECT EXISTS (SELECT 1 FROM {TABLE_FULL})"
+
+
+def _target_has_rows() -> bool:
+    """Czy tabela cen ma dane — pusta (np. po TRUNCATE) wymusza pełny import mimo walidatorów."""
+    try:
+        with get_conn_app() as conn, conn.cursor() as cur:
+            cur.execute(SQL_HAS_ROWS)
+            return bool(cur.fetchone()[0])
+    except Exception as e:
+        log.warning("tge: nie sprawdzono %s (%s) — pełny import", TABLE_FULL, e)
+        return False
 
 
 def full_import() -> None:
-    """Pełna historia – używamy ?all=1."""
+    """
+    Pełna historia – używamy ?all=1. Najpierw HEAD: bez zmian od ostatniego importu → pomijamy,
+    o ile tabela cen nie jest pusta i nie ustawiono TGE_FULL_FORCE.
+    """
     url = _url_full()
+
+    # Lekki HEAD: serwer raportuje to samo co przy ostatnim udanym imporcie → pomijamy całość
+    validators: dict[str, Any] = {}
     try:
-        payload = _fetch(url)
+        validators = _head(url)
+    except Exception as e:
+        log.warning("tge: HEAD nieudany (%s) — pełne pobranie bez sprawdzania zmian", e)
+    if settings.TGE_FULL_FORCE:
+        log.info("tge: pełny import wymuszony (TGE_FULL_FORCE)")
+    elif validators and _unchanged(_load_validators(url), validators) and _target_has_rows():
+        log.info("tge: pełny import — brak zmian po stronie API (HEAD), pomijam")
+        return
+
+    try:
+        cols = _rows_from_payload(_fetch_records(url))
     except Exception as e:
         log.error("tge: błąd krytyczny przy pełnym imporcie: %s", e)
         return
 
-    rows = _rows_from_payload(payload)
-    n = _upsert_rows(rows)
+    n = _copy_upsert(cols)
+    _store_validators(url, validators)
 
-    if rows:
+    if cols:
+        ts_min, ts_max = cols.span()
         log.info("tge: pełny import OK, upsert=%d, zakres=%s → %s",
-                 n, rows[0][0].isoformat(), rows[-1][0].isoformat())
+                 n, ts_min, ts_max)
     else:
         log.info("tge: pełny import — brak danych")
 
 
 def update_import() -> None:
-    """Aktualizacja – ostatnie settings.TGE_HISTORY_DAYS dni przez ?days=..."""
+    """
+    Aktualizacja – ostatnie settings.TGE_HISTORY_DAYS dni przez ?days=... (warunkowy GET).
+    Zapisane walidatory pomijamy przy TGE_FULL_FORCE albo pustej tabeli cen (np. po TRUNCATE).
+    """
     days = int(settings.TGE_HISTORY_DAYS)
     url = _url_days(days)
+    if settings.TGE_FULL_FORCE:
+        log.info("tge: update wymuszony (TGE_FULL_FORCE) — bez warunkowego GET")
+        stored = {}
+    elif not _target_has_rows():
+        log.info("tge: update — %s pusta, pobieram bez warunków", TABLE_FULL)
+        stored = {}
+    else:
+        stored = _load_validators(url)
     try:
-        payload = _fetch(url)
+        payload, validators = _fetch(url, stored)
     except Exception as e:
         log.error("tge: błąd update: %s", e)
         return
 
-    rows = _rows_from_payload(payload)
-    n = _upsert_rows(rows)
+    if payload is NOT_MODIFIED:
+        log.info("tge: update — brak zmian po stronie API (304), pomijam")
+        return
+
+    cols = _rows_from_payload(payload)
+    n = _upsert_rows(cols)
+    _store_validators(url, validators)
 
-    if rows:
+    if cols:
+        ts_min, ts_max = cols.span()
         log.info("tge: update OK, upsert=%d, zakres=%s → %s",
-                 n, rows[0][0].isoformat(), rows[-1][0].isoformat())
+                 n, ts_min, ts_max)
     else:
         log.info("tge: update — brak nowych danych")
@@ -1,17 +1,15 @@
 from __future__ import annotations
-import csv
 from pathlib import Path
 
+_DELIMITERS = ";,\t"
+
 def sniff_delimiter(path: Path, sample_size: int = 4096) -> str | None:
     """
     Lekka detekcja separatora CSV (użyteczna, gdy pliki zewnętrzne nie mają gwarantowanego formatu).
+    Liczy wystąpienia kandydatów w pierwszej linii (nagłówku) — bez csv.Sniffer.
     Zwraca: ';' | ',' | '\t' | None
     """
     with path.open("r", encoding="utf-8", newline="") as f:
-        sample = f.read(sample_size)
-    sniffer = csv.Sniffer()
-    try:
-        dialect = sniffer.sniff(sample, delimiters=";, \t")
-        return dialect.delimiter
-    except Exception:
-        return None
+        first_line = f.readline(sample_size)
+    best = max(_DELIMITERS, key=first_line.count)
+    return best if first_line.count(best) > 0 else None
@@ -1,6 +1,21 @@
 from __future__ import annotations
+import functools
 from datetime import datetime
+from typing import Iterable, Iterator
 from zoneinfo import ZoneInfo
 
+@functools.lru_cache(maxsize=8)
+def _zi(tz: str) -> ZoneInfo:
+    return ZoneInfo(tz)
+
+# Domyślna strefa projektu — gotowa od importu (bez nawet odczytu z cache)
+_WARSAW = _zi("Europe/Warsaw")
+
 def to_local(ts_utc: datetime, tz: str = "Europe/Warsaw") -> datetime:
-    return ts_utc.astimezone(ZoneInfo(tz)).replace(tzinfo=None)
+    zone = _WARSAW if tz == "Europe/Warsaw" else _zi(tz)
+    return ts_utc.astimezone(zone).replace(tzinfo=None)
+
+def to_local_many(ts_iter: Iterable[datetime], tz: str = "Europe/Warsaw") -> Iterator[datetime]:
+    """Wersja wsadowa to_local — strefa wyszukana raz dla całej serii."""
+    zone = _WARSAW if tz == "Europe/Warsaw" else _zi(tz)
+    return (ts.astimezone(zone).replace(tzinfo=None) for ts in ts_iter)
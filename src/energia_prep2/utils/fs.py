@@ -1,8 +1,14 @@
 from __future__ import annotations
+import os
+import stat
 from pathlib import Path
 
 def ensure_dir(p: Path) -> None:
     p.mkdir(parents=True, exist_ok=True)
 
 def file_exists(p: Path) -> bool:
-    return p.exists() and p.is_file()
+    # jeden stat() zamiast exists() + is_file()
+    try:
+        return stat.S_ISREG(os.stat(p).st_mode)
+    except (OSError, ValueError):
+        return False
@@ -0,0 +1,124 @@
+# tests/test_calc_cache.py
+# Cache kalkulacji w runnerze (CALC_CACHE=1): trafienie → alias, brak trafienia, unieważnienie po zmianie wejść.
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from energia_prep2.calc import runner
+
+NORM = {"moc_mw": 2.0, "__raw": {"ignored": True}}
+
+
+class _Miss(Exception):
+    """Sygnał: runner przeszedł do etapu 01 (brak trafienia w cache)."""
+
+
+class FakeCursor:
+    def __init__(self, con):
+        self.con = con
+        self._row = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query, params=None, **kw):
+        if query == runner.SQL_INPUTS_VERSION:
+            self._row = tuple(self.con.versions)
+        elif query == runner.SQL_CACHE_LOOKUP:
+            cached = self.con.cache.get(params[0])
+            self._row = (cached,) if cached else None
+        elif query == runner.SQL_CACHE_ALIAS:
+            self.con.aliases.append(params)
+            self._row = None
+        else:
+            raise AssertionError(f"nieoczekiwane SQL: {query}")
+
+    async def fetchone(self):
+        return self._row
+
+
+class FakeCon:
+    def __init__(self, versions):
+        self.versions = list(versions)
+        self.cache: dict[str, str] = {}
+        self.aliases: list[tuple] = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+@pytest.fixture
+def patched(monkeypatch):
+    async def _noop(*a, **kw):
+        return None
+
+    async def _norm(*a, **kw):
+        return dict(NORM)
+
+    async def _advance(*a, **kw):
+        raise _Miss()
+
+    snapshot = SimpleNamespace(dump_params_snapshot=_noop, build_params_snapshot_consolidated=_norm)
+    mods = {key: SimpleNamespace() for key in runner._STAGE_FILES}
+    mods["snapshot"] = snapshot
+
+    monkeypatch.setattr(runner, "CALC_CACHE", True)
+    monkeypatch.setattr(runner, "_stage_modules", lambda: mods)
+    monkeypatch.setattr(runner, "_stage_begin", _noop)
+    monkeypatch.setattr(runner, "_stage_done", _noop)
+    monkeypatch.setattr(runner, "_stage_fail", _noop)
+    monkeypatch.setattr(runner, "_stage_advance", _advance)
+
+
+def _run(con):
+    return asyncio.run(runner.run_calc(con, job_id=1, params_ts=None))
+
+
+def test_cache_hit_records_alias(patched):
+    con = FakeCon(["dd-v1", "k-v1", "p-v1", "c-v1"])
+    key = asyncio.run(runner._calc_cache_key(con, NORM))
+    con.cache[key] = "old-calc"
+
+    calc_id = _run(con)
+
+    # nowy calc_id (nie cudzy), jawnie powiązany z kalkulacją, której wyniki są w output
+    assert calc_id != "old-calc"
+    assert len(con.aliases) == 1
+    assert con.aliases[0][:2] == (calc_id, "old-calc")
+    assert con.aliases[0][4] == key
+
+
+def test_cache_miss_runs_stages(patched):
+    con = FakeCon(["dd-v1", "k-v1", "p-v1", "c-v1"])
+    with pytest.raises(_Miss):
+        _run(con)
+    assert con.aliases == []
+
+
+def test_cache_invalidated_by_input_change(patched):
+    con = FakeCon(["dd-v1", "k-v1", "p-v1", "c-v1"])
+    con.cache[asyncio.run(runner._calc_cache_key(con, NORM))] = "old-calc"
+
+    # nowy upsert cen → inna wersja tabeli → inny klucz
+    con.versions[3] = "c-v2"
+    with pytest.raises(_Miss):
+        _run(con)
+    assert con.aliases == []
+
+
+def test_cache_key_ignores_raw_params():
+    con = FakeCon(["dd-v1", "k-v1", "p-v1", "c-v1"])
+    k1 = asyncio.run(runner._calc_cache_key(con, NORM))
+    k2 = asyncio.run(runner._calc_cache_key(con, {**NORM, "__raw": {"other": 1}}))
+    k3 = asyncio.run(runner._calc_cache_key(con, {**NORM, "moc_mw": 3.0}))
+    assert k1 == k2
+    assert k1 != k3
@@ -0,0 +1,49 @@
+# tests/test_tge_rows.py
+# Parsowanie rekordów TGE (tge_fetch._rows_from_payload) i paczki pod unnest (_pages).
+from energia_prep2.tasks import tge_fetch as tge
+
+
+def _rec(date, price=1.0):
+    return {
+        "date": date,
+        "fixing_i": {"price": price, "volume": 10},
+        "fixing_ii": {"price": None, "volume": None},
+    }
+
+
+def test_rows_canonical_utc_and_invalid_skipped():
+    cols = tge._rows_from_payload({"data": [
+        _rec("2024-03-01T10:00:00Z"),
+        _rec("2024-03-01T12:00:00+01:00"),
+        _rec("not-a-dateZ"),
+        _rec("also bad"),
+        {"fixing_i": {}},
+    ]})
+    assert cols.ts_utc == ["2024-03-01T10:00:00+00:00", "2024-03-01T11:00:00+00:00"]
+    assert cols.fixing_i_price == [1.0, 1.0]
+    assert cols.fixing_ii_price == [None, None]
+    assert cols.span() == (
+        "2024-03-01T10:00:00+00:00",
+        "2024-03-01T11:00:00+00:00",
+    )
+
+
+def test_pages_dedup_same_instant_spelled_differently():
+    cols = tge._rows_from_payload([
+        _rec("2024-03-01T10:00:00Z", 1.0),
+        _rec("2024-03-01T11:00:00+01:00", 2.0),  # ta sama chwila co wyżej
+        _rec("2024-03-01T11:00:00.000Z", 3.0),
+        _rec("2024-03-01T11:00:00Z", 4.0),  # ta sama chwila — wygrywa ostatni
+    ])
+    pages = list(tge._pages(cols, 1000))
+    assert len(pages) == 1
+    ts, fi_price = pages[0][0], pages[0][1]
+    assert ts == ["2024-03-01T10:00:00+00:00", "2024-03-01T11:00:00+00:00"]
+    assert fi_price == [2.0, 4.0]
+
+
+def test_pages_split_by_size():
+    recs = [_rec(f"2024-03-01T{h:02d}:00:00Z") for h in range(5)]
+    cols = tge._rows_from_payload(recs)
+    pages = list(tge._pages(cols, 2))
+    assert [len(p[0]) for p in pages] == [2, 2, 1]